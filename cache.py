@@ -0,0 +1,399 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from resilience import remaining_time
+
+# Key namespaces. Bump KEY_VERSION when the format of a cached value changes.
+KEY_PREFIX = "heydj"
+KEY_VERSION = "v2"
+LLM_OUTPUT = "llm"
+RESOLUTION = "resolution"
+TAG_LIST = "tags"
+LYRIC_LIST = "lyrics"
+TRACK = "track"
+AUDIO_FEATURES = "features"
+SEARCH = "search"
+
+# Default time to live of each namespace in seconds.
+TTLS = {
+    LLM_OUTPUT: 7 * 24 * 3600,
+    RESOLUTION: 30 * 24 * 3600,
+    TAG_LIST: 24 * 3600,
+    LYRIC_LIST: 24 * 3600,
+    TRACK: 7 * 24 * 3600,
+    AUDIO_FEATURES: 30 * 24 * 3600,
+    SEARCH: 30 * 24 * 3600,
+}
+
+
+def normalize_text(text=""):
+    """
+    Normalizes user input and search queries so equivalent requests share a store or cache entry.
+
+    Attributes:
+        text (str): Text to normalize.
+
+    Returns:
+        str: Lowercased text with collapsed whitespace and without surrounding punctuation.
+    """
+    text = re.sub(r"\s+", " ", text.lower())
+    return text.strip(" .,!?;:\"'")
+
+
+def cache_key(namespace, *parts):
+    """
+    Builds a cache key that is identical on every replica.
+
+    Attributes:
+        namespace (str): One of the key namespaces (LLM_OUTPUT, RESOLUTION, TAG_LIST, LYRIC_LIST, TRACK,
+            AUDIO_FEATURES, SEARCH).
+        parts: Values identifying the cached item. Callers normalize free text before passing it.
+
+    Returns:
+        str: A key in the form "heydj:v2:<namespace>:<sha256 of the parts>".
+    """
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f"{KEY_PREFIX}:{KEY_VERSION}:{namespace}:{digest}"
+
+
+class CacheBackend(ABC):
+    """
+    Interface of the cache backends. Values are stored as JSON, so every backend returns the
+    same types. None is used to signal a miss and is never stored.
+
+    Subclasses implement get, set, add, delete and delete_if_equal, and may override set_many to
+    store several values in one round trip.
+    """
+    # Whether the backend is shared between replicas. Lock entries are only needed for shared backends.
+    shared = True
+
+    # In-process locks of the keys being computed, with the number of callers using each lock,
+    # so concurrent misses of a key in one process compute it once.
+    _local_locks = {}
+    _local_locks_guard = threading.Lock()
+
+    @abstractmethod
+    def get(self, key):
+        """Returns the value of a key, or None if the key is missing or expired."""
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        """Stores a value under a key. The value expires after ttl seconds if given."""
+
+    @abstractmethod
+    def add(self, key, value, ttl=None):
+        """Stores a value only if the key doesn't exist. Returns whether the value was stored."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Removes a key."""
+
+    @abstractmethod
+    def delete_if_equal(self, key, value):
+        """Removes a key only if it holds the given value, in one atomic step."""
+
+    def set_many(self, items, ttl=None):
+        """Stores the values of a {key: value} dictionary. The values expire after ttl seconds if given."""
+        for key, value in items.items():
+            self.set(key, value, ttl=ttl)
+
+    @contextmanager
+    def _local_lock(self, key, timeout):
+        """Holds the in-process lock of a key for up to timeout seconds, then continues without it."""
+        with self._local_locks_guard:
+            entry = self._local_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        acquired = entry[0].acquire(timeout=timeout)
+        try:
+            yield
+        finally:
+            if acquired:
+                entry[0].release()
+            with self._local_locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._local_locks[key]
+
+    def get_or_set(self, key, compute, ttl=None, lock_timeout=30.0, poll_interval=0.05, cache_if=None, shared_lock=True):
+        """
+        Returns the cached value of a key, computing and storing it on a miss.
+
+        Only one caller across all replicas computes a missing value. The others wait for it to
+        appear, and compute it themselves if it doesn't appear within lock_timeout seconds or before
+        the current request's deadline. The lock of a replica is stored with a random token, so
+        only its holder releases it. Values that are cheap to compute can skip the lock entry with
+        shared_lock=False: concurrent misses are then only merged within a process, and a miss costs
+        a single write.
+
+        Attributes:
+            key (str): Cache key, built with cache_key.
+            compute (callable): Function without arguments that returns the value. A None result
+                isn't stored.
+            ttl (float): Seconds the value stays cached (default: no expiry).
+            lock_timeout (float): Seconds the computing lock is held at most, and seconds a caller
+                waits for another one to compute the value.
+            poll_interval (float): Seconds between checks while another replica computes.
+            cache_if (callable): Function taking the computed value and returning whether to store it
+                (default: every value except None is stored).
+            shared_lock (bool): Whether replicas coordinate through a lock entry (default: True).
+
+        Returns:
+            The cached or computed value.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        # Waiting doesn't outlast the current request's deadline.
+        remaining = remaining_time()
+        wait_time = lock_timeout if remaining is None else min(lock_timeout, remaining)
+        wait_until = time.monotonic() + wait_time
+        with self._local_lock(key, wait_time):
+            value = self.get(key)
+            if value is not None:
+                return value
+
+            lock_key = f"{key}:lock"
+            token = uuid.uuid4().hex
+            use_lock = shared_lock and self.shared
+            locked = use_lock and self.add(lock_key, token, ttl=lock_timeout)
+            while use_lock and not locked and time.monotonic() < wait_until:
+                time.sleep(poll_interval)
+                value = self.get(key)
+                if value is not None:
+                    return value
+                locked = self.add(lock_key, token, ttl=lock_timeout)
+
+            try:
+                value = compute()
+                if value is not None and (cache_if is None or cache_if(value)):
+                    self.set(key, value, ttl=ttl)
+            finally:
+                if locked:
+                    self.delete_if_equal(lock_key, token)
+            return value
+
+
+class MemoryCache(CacheBackend):
+    """
+    In-process LRU cache. Not shared between replicas.
+    Attributes:
+        max_entries (int): Number of entries kept before the least recently used one is evicted.
+    """
+    shared = False
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live_entry(self, key):
+        """Returns the (value, expires) entry of a key, dropping it if it expired. Caller must hold _lock."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._entries[key]
+            return None
+        return entry
+
+    def _store(self, key, value, ttl):
+        """Stores an entry and evicts the least recently used ones. Caller must hold _lock."""
+        self._entries[key] = (json.dumps(value), time.time() + ttl if ttl else None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(entry[0])
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def set_many(self, items, ttl=None):
+        with self._lock:
+            for key, value in items.items():
+                self._store(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            if self._live_entry(key) is not None:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_if_equal(self, key, value):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is not None and json.loads(entry[0]) == value:
+                del self._entries[key]
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache stored in a SQLite database, shared by the replicas running on the same host. A
+    persistent rollback journal is used instead of WAL, which needs shared memory between the
+    processes, but SQLite locking is still unreliable on network file systems: use RedisCache
+    across hosts. Expired entries are purged every purge_interval seconds.
+    Attributes:
+        path (str): Path of the SQLite database file.
+        purge_interval (float): Seconds between purges of expired entries.
+    """
+    def __init__(self, path="cache.db", purge_interval=3600.0):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        # The journal file is kept between transactions instead of being created and deleted for each
+        # write, and the database is synced at checkpoints only. A cache can afford losing the last
+        # writes on a power failure.
+        self._connection.execute("PRAGMA journal_mode=PERSIST")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+        self._last_purge = 0.0
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl=ttl)
+
+    def set_many(self, items, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        rows = [(key, json.dumps(value), expires) for key, value in items.items()]
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", rows)
+                self._connection.execute("COMMIT")
+            except sqlite3.Error:
+                self._connection.execute("ROLLBACK")
+                raise
+        self._purge_if_due()
+
+    def purge_expired(self):
+        """Deletes all expired entries."""
+        self._last_purge = time.monotonic()
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+
+    def _purge_if_due(self):
+        """Purges expired entries if the last purge was more than purge_interval seconds ago."""
+        if time.monotonic() - self._last_purge >= self.purge_interval:
+            self.purge_expired()
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        expires = now + ttl if ttl else None
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute("DELETE FROM cache WHERE key = ? AND expires <= ?", (key, now))
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO cache VALUES (?, ?, ?)", (key, json.dumps(value), expires)
+                )
+                self._connection.execute("COMMIT")
+            except sqlite3.Error:
+                self._connection.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_if_equal(self, key, value):
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE key = ? AND value = ?", (key, json.dumps(value)))
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache stored in a server that speaks the Redis protocol (Redis, Valkey, KeyDB, ...).
+    Requires the optional redis package.
+    Attributes:
+        url (str): Server URL, e.g. "redis://localhost:6379/0".
+        client: A ready redis client to use instead of connecting to url (e.g. fakeredis in tests).
+    """
+    def __init__(self, url="redis://localhost:6379/0", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("RedisCache requires the redis package: pip install redis") from e
+            client = redis.Redis.from_url(url)
+        self._client = client
+
+    def get(self, key):
+        value = self._client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def set_many(self, items, ttl=None):
+        with self._client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(key, json.dumps(value), px=int(ttl * 1000) if ttl else None)
+            pipe.execute()
+
+    def add(self, key, value, ttl=None):
+        return bool(self._client.set(key, json.dumps(value), px=int(ttl * 1000) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def delete_if_equal(self, key, value):
+        from redis.exceptions import WatchError
+
+        with self._client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                stored = pipe.get(key)
+                if stored is not None and json.loads(stored) == value:
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.execute()
+            except WatchError:
+                pass # The key changed in the meantime, so it isn't ours anymore.
+
+
+@lru_cache(maxsize=None)
+def get_cache():
+    """
+    Returns the cache backend shared by the app, configured with environment variables:
+        - CACHE_BACKEND: "sqlite" (default), "memory" or "redis".
+        - CACHE_PATH: Database file of the sqlite backend (default: "cache.db").
+        - CACHE_URL: Server URL of the redis backend (default: "redis://localhost:6379/0").
+
+    Returns:
+        CacheBackend: The configured cache backend.
+    """
+    backend = os.getenv("CACHE_BACKEND", "sqlite").lower()
+    if backend == "sqlite":
+        return SQLiteCache(os.getenv("CACHE_PATH", "cache.db"))
+    if backend == "redis":
+        return RedisCache(os.getenv("CACHE_URL", "redis://localhost:6379/0"))
+    if backend == "memory":
+        return MemoryCache()
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
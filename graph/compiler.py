@@ -1,3 +1,4 @@
+from cache import get_cache, cache_key, normalize_text, LLM_OUTPUT, TTLS
 from graph.nodes.description_generation import description_generator
 from graph.nodes.lyric_query_generation import lyric_query_generator
 from graph.nodes.playlist_name_generation import playlist_name_generator
@@ -5,14 +6,30 @@ from graph.nodes.query_classification import query_classifier
 from graph.nodes.search_query_generation import search_query_generator
 from graph.nodes.tag_generation import tag_generator
 from graph.state import GraphState
+from groq import APIConnectionError, APITimeoutError, BadRequestError, InternalServerError, RateLimitError
+from langchain_core.exceptions import OutputParserException
+from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, START, END
+from langgraph.types import RetryPolicy
+from functools import wraps
+from resilience import breakers, check_deadline
+import hashlib
 
 # LangGraph Workflow
 workflow = StateGraph(GraphState)
 
+# Upstream service each search function depends on besides Spotify.
+SEARCH_UPSTREAMS = {
+    "search_songs_by_lyrics": "genius",
+    "search_songs_by_tag": "lastfm",
+}
+
 # Conditional Edges
 def search_query_router(state:GraphState):
     search_function = state.get("search_function")
+    upstream = SEARCH_UPSTREAMS.get(search_function)
+    if upstream and breakers[upstream].is_open:
+        return "degraded_search_songs" # Upstream is down, fall back to a plain Spotify search.
     if search_function == "search_songs":
         return "search_songs"
     elif search_function == "search_songs_by_lyrics":
@@ -21,13 +38,51 @@ def search_query_router(state:GraphState):
         return "search_songs_by_tag"
 
 
+def degraded_search_query_generator(state:GraphState):
+    """
+    Generates a Spotify search query when the upstream of the chosen search function is unavailable.
+    Attributes:
+        state (dict): Current state of the graph.
+    Returns:
+        state (dict): LLM generated search query, with the search function switched to plain Spotify search.
+    """
+    output = search_query_generator(state)
+    output["search_function"] = "search_songs"
+    output["degraded"] = True
+    return output
+
+
+# Retry Policy
+def should_retry(exception):
+    """Retries a node when its output can't be parsed, the connection fails or Groq is overloaded."""
+    if isinstance(exception, APITimeoutError):
+        return False # Timeouts already fell back to the other model tier, retrying would only stack them up.
+    if isinstance(exception, (OutputParserException, APIConnectionError, RateLimitError, InternalServerError)):
+        return True
+    # Raised by Groq's JSON mode when the model produces invalid JSON.
+    return isinstance(exception, BadRequestError) and "json_validate_failed" in str(exception)
+
+# Only the failed node is re-run, the outputs of completed nodes are kept.
+node_retry_policy = RetryPolicy(max_attempts=3, initial_interval=0.2, retry_on=should_retry)
+
+
+def deadline_checked(node):
+    """Wraps a node so it isn't started, or retried, once the request's deadline has passed."""
+    @wraps(node)
+    def run_node(state):
+        check_deadline(f"running {node.__name__}")
+        return node(state)
+    return run_node
+
+
 # Nodes
-workflow.add_node("description_generator", description_generator)
-workflow.add_node("lyric_query_generator", lyric_query_generator)
-workflow.add_node("playlist_name_generator", playlist_name_generator)
-workflow.add_node("query_classifier", query_classifier)
-workflow.add_node("search_query_generator", search_query_generator)
-workflow.add_node("tag_generator", tag_generator)
+workflow.add_node("description_generator", deadline_checked(description_generator), retry_policy=node_retry_policy)
+workflow.add_node("lyric_query_generator", deadline_checked(lyric_query_generator), retry_policy=node_retry_policy)
+workflow.add_node("playlist_name_generator", deadline_checked(playlist_name_generator), retry_policy=node_retry_policy)
+workflow.add_node("query_classifier", deadline_checked(query_classifier), retry_policy=node_retry_policy)
+workflow.add_node("search_query_generator", deadline_checked(search_query_generator), retry_policy=node_retry_policy)
+workflow.add_node("degraded_search_query_generator", deadline_checked(degraded_search_query_generator), retry_policy=node_retry_policy)
+workflow.add_node("tag_generator", deadline_checked(tag_generator), retry_policy=node_retry_policy)
 
 # Workflow
 workflow.add_edge(START, "query_classifier")
@@ -36,17 +91,22 @@ workflow.add_conditional_edges("query_classifier", search_query_router,
                                    "search_songs":"search_query_generator",
                                    "search_songs_by_lyrics":"lyric_query_generator",
                                    "search_songs_by_tag":"tag_generator",
+                                   "degraded_search_songs":"degraded_search_query_generator",
                                }
                                )
 workflow.add_edge("search_query_generator","playlist_name_generator")
+workflow.add_edge("degraded_search_query_generator","playlist_name_generator")
 workflow.add_edge("lyric_query_generator","playlist_name_generator")
 workflow.add_edge("tag_generator","playlist_name_generator")
 workflow.add_edge("playlist_name_generator","description_generator")
 workflow.add_edge("description_generator",END)
-compiled_workflow = workflow.compile()
+
+# Checkpointer keeps the outputs of completed nodes, so a failed run can be resumed instead of restarted.
+checkpointer = MemorySaver()
+compiled_workflow = workflow.compile(checkpointer=checkpointer)
 
 # Main Function.
-def playlist_info_generator(input=""):
+def playlist_info_generator(input="", thread_id=None):
     """
     Generates playlist-related information based on user input.
 
@@ -55,8 +115,14 @@ def playlist_info_generator(input=""):
     2. Generate a search query and playlist name.
     3. Create a description for the playlist.
 
+    Results are cached by normalized input. If a previous run on the same thread failed, the run is
+    resumed from its last checkpoint and only the remaining nodes are executed. Under a request
+    deadline (see resilience.request_deadline), nodes aren't started and LLM calls are cut short
+    once the deadline passes.
+
     Attributes:
         input (str): User input (e.g., a search query).
+        thread_id (str): Identifier of the checkpoint thread (default: derived from the input).
 
     Returns:
         dict: A dictionary containing:
@@ -65,14 +131,45 @@ def playlist_info_generator(input=""):
             - "playlist_name": Suggested playlist name.
             - "search_function": The determined search function.
             - "search_query": Generated search query.
+            - "degraded": Whether a plain Spotify search was chosen because the upstream service of
+              the classified search function was unavailable.
+    """
+    if thread_id is None:
+        thread_id = hashlib.sha256(input.encode("utf-8")).hexdigest()
+    config = {"configurable": {"thread_id": thread_id}}
+
+    def run_workflow():
+        """Runs the workflow, resuming the failed run of the thread if there is one."""
+        snapshot = compiled_workflow.get_state(config)
+        if snapshot.next and snapshot.values.get("input") == input:
+            result = compiled_workflow.invoke(None, config) # Resume the failed run.
+        else:
+            # A failed run of another input is dropped, so none of its state leaks into this run.
+            checkpointer.delete_thread(thread_id)
+            input_dict = {"input": input, "degraded": False}
+            result = compiled_workflow.invoke(input_dict, config)
+        checkpointer.delete_thread(thread_id) # Completed runs don't need their checkpoints.
+
+        return {
+            "input": result["input"],
+            "description": result["description"],
+            "playlist_name": result["playlist_name"],
+            "search_function": result["search_function"],
+            "search_query": result["search_query"],
+            "degraded": result.get("degraded", False)
+        }
+
+    # Outputs are shared through the cache, so a playlist idea generated on one replica is reused by the others.
+    # Degraded outputs aren't cached, the next request should use the intended search function again.
+    key = cache_key(LLM_OUTPUT, normalize_text(input))
+    return get_cache().get_or_set(key, run_workflow, ttl=TTLS[LLM_OUTPUT], cache_if=lambda playlist_info: not playlist_info["degraded"])
+
+
+def forget_playlist_info(input=""):
+    """
+    Removes the cached playlist info of a user input, so the next request runs the workflow again.
+
+    Attributes:
+        input (str): User input the playlist info was generated from.
     """
-    input_dict = {"input": input}
-    result = compiled_workflow.invoke(input_dict)
-    playlist_info = {
-        "input": result["input"],
-        "description": result["description"].description,
-        "playlist_name": result["playlist_name"].playlist_name,
-        "search_function": result["search_function"].search_function,
-        "search_query": result["search_query"].search_query
-    }
-    return playlist_info
\ No newline at end of file
+    get_cache().delete(cache_key(LLM_OUTPUT, normalize_text(input)))
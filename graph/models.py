@@ -1,20 +1,178 @@
 from langchain_groq import ChatGroq
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
+from functools import lru_cache
+from groq import APITimeoutError
+from resilience import capped_timeout, check_deadline
+import httpx
 import os
+import threading
+import time
 
 load_dotenv()
 groq_api_key = os.getenv("GROQ_API_KEY")
 
-# Used when low temperature is necessary.
-decidier_llm = ChatGroq(
-    temperature=0.0,
-    groq_api_key=groq_api_key,
-    model_name="llama-3.3-70b-versatile"
-)
-
-# Used when relatively high temperature is necessary.
-text_generator_llm = ChatGroq(
-    temperature=0.7,
-    groq_api_key=groq_api_key,
-    model_name="llama-3.3-70b-versatile"
-)
\ No newline at end of file
+# Model tiers. Small model handles short, structured tasks; large model handles free text generation.
+MODEL_TIERS = {
+    "small": os.getenv("GROQ_SMALL_MODEL", "llama-3.1-8b-instant"),
+    "large": os.getenv("GROQ_LARGE_MODEL", "llama-3.3-70b-versatile"),
+}
+
+# Tier to fall back to when a request to the primary tier times out.
+FALLBACK_TIERS = {
+    "small": "large",
+    "large": "small",
+}
+
+REQUEST_TIMEOUT = float(os.getenv("GROQ_REQUEST_TIMEOUT", "10")) # Capped by the time left until the request's deadline.
+
+# Groq's native JSON mode. Makes the models return a bare JSON object instead of free text.
+JSON_MODE = os.getenv("GROQ_JSON_MODE", "true").lower() in ("1", "true", "yes")
+
+# Tier, temperature and max output tokens for each node in graph/nodes.
+NODE_MODELS = {
+    "query_classifier": {"tier": "small", "temperature": 0.0, "max_tokens": 32},
+    "search_query_generator": {"tier": "small", "temperature": 0.0, "max_tokens": 64},
+    "lyric_query_generator": {"tier": "small", "temperature": 0.7, "max_tokens": 32},
+    "tag_generator": {"tier": "small", "temperature": 0.7, "max_tokens": 32},
+    "playlist_name_generator": {"tier": "large", "temperature": 0.7, "max_tokens": 64},
+    "description_generator": {"tier": "large", "temperature": 0.7, "max_tokens": 300},
+}
+
+# Shared HTTP clients so every model reuses the same connection pool.
+http_client = httpx.Client(limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+http_async_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+
+# Per-node token and latency metrics.
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Records token usage and latency of each LLM call made for a graph node.
+    Attributes:
+        node (str): Name of the graph node the model is used by.
+        model_name (str): Name of the model that serves the node.
+    """
+    def __init__(self, node, model_name):
+        self.node = node
+        self.model_name = model_name
+        self._start_times = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start_times[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start_times[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        latency = time.perf_counter() - self._start_times.pop(run_id, time.perf_counter())
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        with _metrics_lock:
+            node_metrics = _node_metrics(self.node)
+            node_metrics["calls"] += 1
+            node_metrics["prompt_tokens"] += token_usage.get("prompt_tokens", 0)
+            node_metrics["completion_tokens"] += token_usage.get("completion_tokens", 0)
+            node_metrics["latency_total"] += latency
+            node_metrics["latency_max"] = max(node_metrics["latency_max"], latency)
+            node_metrics["models"][self.model_name] = node_metrics["models"].get(self.model_name, 0) + 1
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._start_times.pop(run_id, None)
+        with _metrics_lock:
+            node_metrics = _node_metrics(self.node)
+            node_metrics["errors"] += 1
+            if isinstance(error, (APITimeoutError, httpx.TimeoutException)):
+                node_metrics["timeouts"] += 1
+
+
+def _node_metrics(node):
+    """Returns the metrics entry of a node, creating it if necessary. Caller must hold _metrics_lock."""
+    if node not in _metrics:
+        _metrics[node] = {
+            "calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency_total": 0.0,
+            "latency_max": 0.0,
+            "models": {},
+        }
+    return _metrics[node]
+
+
+def _build_llm(node, tier):
+    """
+    Creates a ChatGroq instance of the given tier with the node's settings.
+
+    Calls are rejected once the request's deadline has passed, and the timeout of each call is
+    capped by the time left. Retries are left to the node's retry policy, so a call never takes
+    longer than its timeout.
+    """
+    settings = NODE_MODELS[node]
+    model_name = MODEL_TIERS[tier]
+    llm = ChatGroq(
+        temperature=settings["temperature"],
+        max_tokens=settings["max_tokens"],
+        groq_api_key=groq_api_key,
+        model_name=model_name,
+        request_timeout=REQUEST_TIMEOUT,
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        callbacks=[LLMMetricsCallback(node, model_name)],
+    )
+    if JSON_MODE:
+        llm = llm.bind(response_format={"type": "json_object"})
+
+    def invoke_with_deadline(messages, config):
+        check_deadline(f"calling {model_name}")
+        return llm.invoke(messages, config, timeout=capped_timeout(REQUEST_TIMEOUT))
+
+    return RunnableLambda(invoke_with_deadline, name=model_name)
+
+
+@lru_cache(maxsize=None)
+def get_llm(node):
+    """
+    Returns the LLM assigned to a graph node.
+
+    The model of the node's tier is used first and the model of the fallback tier is used when
+    the request times out.
+
+    Attributes:
+        node (str): Name of the graph node (a key of NODE_MODELS).
+
+    Returns:
+        Runnable: The node's LLM with its timeout fallback.
+    """
+    tier = NODE_MODELS[node]["tier"]
+    primary = _build_llm(node, tier)
+    fallback = _build_llm(node, FALLBACK_TIERS[tier])
+    return primary.with_fallbacks([fallback], exceptions_to_handle=(APITimeoutError, httpx.TimeoutException))
+
+
+def get_llm_metrics():
+    """
+    Returns a snapshot of per-node token and latency metrics.
+
+    Returns:
+        metrics (dict): Node names mapped to their call, error, timeout, token and latency counters.
+            "latency_avg" is the average latency of successful calls in seconds.
+    """
+    with _metrics_lock:
+        snapshot = {}
+        for node, node_metrics in _metrics.items():
+            entry = dict(node_metrics, models=dict(node_metrics["models"]))
+            entry["latency_avg"] = entry["latency_total"] / entry["calls"] if entry["calls"] else 0.0
+            snapshot[node] = entry
+        return snapshot
+
+
+def reset_llm_metrics():
+    """Clears all recorded LLM metrics."""
+    with _metrics_lock:
+        _metrics.clear()
@@ -1,11 +1,11 @@
 from pydantic import BaseModel, Field
-from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
-from graph.models import text_generator_llm
+from graph.models import get_llm
+from graph.parsers import TolerantOutputParser
 from graph.state import GraphState
 from typing import Any, Dict
 
-llm = text_generator_llm
+llm = get_llm("description_generator")
 
 class DescriptionGenerator(BaseModel):
     """
@@ -17,7 +17,7 @@ class DescriptionGenerator(BaseModel):
         """
     )
 
-pydantic_parser = PydanticOutputParser(pydantic_object=DescriptionGenerator)
+pydantic_parser = TolerantOutputParser(pydantic_object=DescriptionGenerator, node="description_generator")
 
 description_prompt = PromptTemplate.from_template(
     """
@@ -48,5 +48,5 @@ def description_generator(state:GraphState) -> Dict[str, Any]:
     """
     input = state['input']
     playlist_name = state['playlist_name']
-    description = description_chain.invoke({"input":input, "playlist_name":playlist_name})
+    description = description_chain.invoke({"input":input, "playlist_name":playlist_name}).description
     return {"input":input, "playlist_name":playlist_name, "description":description}
\ No newline at end of file
@@ -1,10 +1,10 @@
 from pydantic import BaseModel, Field
-from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
-from graph.models import text_generator_llm
+from graph.models import get_llm
+from graph.parsers import TolerantOutputParser
 from graph.state import GraphState
 from typing import Dict, Any
-llm = text_generator_llm
+llm = get_llm("lyric_query_generator")
 
 class QueryGenerator(BaseModel):
     """
@@ -16,7 +16,7 @@ class QueryGenerator(BaseModel):
         """
     )
 
-pydantic_parser = PydanticOutputParser(pydantic_object=QueryGenerator)
+pydantic_parser = TolerantOutputParser(pydantic_object=QueryGenerator, node="lyric_query_generator")
 
 lyric_query_generation_prompt = PromptTemplate.from_template(
     """
@@ -49,6 +49,6 @@ def lyric_query_generator(state:GraphState) -> Dict[str, Any]:
         state (dict): LLM generated lyric query.
     """
     input = state['input']
-    search_query = lyric_query_generation_chain.invoke({"input":input})
+    search_query = lyric_query_generation_chain.invoke({"input":input}).search_query
     return {"input":input, "search_query":search_query}
 
@@ -1,11 +1,11 @@
 from pydantic import BaseModel, Field
-from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
 from graph.state import GraphState
 from typing import Dict, Any
-from graph.models import text_generator_llm
+from graph.models import get_llm
+from graph.parsers import TolerantOutputParser
 
-llm = text_generator_llm
+llm = get_llm("playlist_name_generator")
 
 class PlaylistNameGenerator(BaseModel):
     """
@@ -17,7 +17,7 @@ class PlaylistNameGenerator(BaseModel):
         """
     )
 
-pydantic_parser = PydanticOutputParser(pydantic_object=PlaylistNameGenerator)
+pydantic_parser = TolerantOutputParser(pydantic_object=PlaylistNameGenerator, node="playlist_name_generator")
 
 playlist_name_prompt = PromptTemplate.from_template(
     """
@@ -44,5 +44,5 @@ def playlist_name_generator(state:GraphState) -> Dict[str, Any]:
         state (dict): LLM generated playlist name.
     """
     input = state["input"]
-    playlist_name = playlist_name_chain.invoke({"input":input})
+    playlist_name = playlist_name_chain.invoke({"input":input}).playlist_name
     return {"input":input, "playlist_name":playlist_name}
\ No newline at end of file
@@ -1,28 +1,28 @@
 from pydantic import BaseModel, Field
-from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
-from typing import Dict, Any
+from typing import Dict, Any, Literal
 from graph.state import GraphState
-from graph.models import decidier_llm
+from graph.models import get_llm
+from graph.parsers import TolerantOutputParser
 
-llm = decidier_llm
+llm = get_llm("query_classifier")
 
 class QueryClassifier(BaseModel):
     """
     Classifier for deciding which search function to use.
     """
-    search_function: str =  Field(
+    search_function: Literal["search_songs", "search_songs_by_lyrics", "search_songs_by_tag"] =  Field(
         description="""
         The chosen search function based on the user's query. 
         Possible values are: 'search_songs', 'search_songs_by_lyrics', or 'search_songs_by_tag'. This field represents the classifier's decision.
         """
     )
 
-pydantic_parser = PydanticOutputParser(pydantic_object=QueryClassifier)
+pydantic_parser = TolerantOutputParser(pydantic_object=QueryClassifier, node="query_classifier")
 
 classification_prompt = PromptTemplate.from_template(
     """
-    Your task is to analyze the given text and determine the user's intent based on their query. Choose and return only one of the following options in the form of a dictionary:
+    Your task is to analyze the given text and determine the user's intent based on their query. Choose and return only one of the following options as a JSON object:
     
     1. {{"search_function": "search_songs"}} - If the user is looking for songs by name, artist, or making a general song search.
     2. {{"search_function": "search_songs_by_lyrics"}} - If the user is searching for a song based on its lyrics.
@@ -30,7 +30,7 @@ classification_prompt = PromptTemplate.from_template(
     
     Input text: {input}
     
-    Please return only one of the above options in dictionary format and no additional explanation.
+    Please return only one of the above options in JSON format and no additional explanation.
     """
 
 )
@@ -46,5 +46,5 @@ def query_classifier(state:GraphState) -> Dict[str, Any]:
         state (dict): LLM's decision.
     """
     input = state["input"]
-    search_function = query_classification_chain.invoke({"input":input})
+    search_function = query_classification_chain.invoke({"input":input}).search_function
     return {"input":input, "search_function":search_function}
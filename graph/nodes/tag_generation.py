@@ -1,11 +1,11 @@
 from pydantic import BaseModel, Field
-from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import PromptTemplate
-from graph.models import text_generator_llm
+from graph.models import get_llm
+from graph.parsers import TolerantOutputParser
 from graph.state import GraphState
 from typing import Dict, Any
 
-llm = text_generator_llm
+llm = get_llm("tag_generator")
 
 class QueryGenerator(BaseModel):
     """
@@ -17,7 +17,7 @@ class QueryGenerator(BaseModel):
         """
     )
 
-pydantic_parser = PydanticOutputParser(pydantic_object=QueryGenerator)
+pydantic_parser = TolerantOutputParser(pydantic_object=QueryGenerator, node="tag_generator")
 
 tag_generation_prompt = PromptTemplate.from_template(
     """
@@ -51,5 +51,5 @@ def tag_generator(state:GraphState) -> Dict[str, Any]:
         state (dict): LLM generated tag.
     """
     input = state["input"]
-    search_query = tag_generation_chain.invoke({"input":input})
+    search_query = tag_generation_chain.invoke({"input":input}).search_query
     return {"input":input, "search_query":search_query}
\ No newline at end of file
@@ -0,0 +1,171 @@
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser
+from pydantic import ValidationError
+import json
+import re
+import threading
+from typing import Literal, get_args, get_origin
+
+# Per-node parse metrics.
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+# Characters models tend to emit instead of plain double quotes.
+SMART_QUOTES = {"“": '"', "”": '"', "‘": "'", "’": "'"}
+
+# Longest plain text answer, in words, that is used as the value of a single string field.
+MAX_PLAIN_TEXT_WORDS = 8
+
+
+def _find_json_object(text):
+    """Returns the first balanced {...} block in the text, or None if there isn't one."""
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        in_string = False
+        quote = ""
+        escaped = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == quote:
+                    in_string = False
+            elif char in "\"'":
+                in_string = True
+                quote = char
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return text[start:index + 1]
+        start = text.find("{", start + 1)
+    return None
+
+
+def _repair_json(candidate):
+    """Fixes the most common JSON mistakes of LLMs: smart quotes, single quotes and trailing commas."""
+    for smart_quote, quote in SMART_QUOTES.items():
+        candidate = candidate.replace(smart_quote, quote)
+    candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
+    if '"' not in candidate:
+        candidate = candidate.replace("'", '"')
+    else:
+        # Single quoted keys and values next to double quoted ones, e.g. {'search_query': "love"}.
+        candidate = re.sub(r"'([^'\"]*)'(\s*[:,}])", r'"\1"\2', candidate)
+        candidate = re.sub(r"([{:,]\s*)'([^'\"]*)'", r'\1"\2"', candidate)
+    return candidate
+
+
+def extract_json(text):
+    """
+    Extracts a JSON object from model output that may contain code fences or surrounding prose.
+
+    Attributes:
+        text (str): Raw model output.
+
+    Returns:
+        tuple: The parsed JSON object (dict) and whether the text needed repairing (bool).
+
+    Raises:
+        ValueError: If no JSON object can be extracted from the text.
+    """
+    stripped = text.strip()
+    try:
+        obj = json.loads(stripped)
+        if isinstance(obj, dict):
+            return obj, False
+    except ValueError:
+        pass
+
+    candidate = _find_json_object(stripped)
+    if candidate is None:
+        raise ValueError("No JSON object found in the model output.")
+    for repaired in (candidate, _repair_json(candidate)):
+        try:
+            obj = json.loads(repaired)
+        except ValueError:
+            continue
+        if isinstance(obj, dict):
+            return obj, True
+    raise ValueError("Model output contains a malformed JSON object.")
+
+
+def _record(node, outcome):
+    """Increments the counter of a parse outcome ("parsed", "repaired" or "failed") for a node."""
+    with _metrics_lock:
+        node_metrics = _metrics.setdefault(node, {"parsed": 0, "repaired": 0, "failed": 0})
+        node_metrics[outcome] += 1
+
+
+class TolerantOutputParser(PydanticOutputParser):
+    """
+    Pydantic output parser that recovers the JSON object from noisy model output.
+
+    Text around the JSON object, code fences, smart quotes, single quotes and trailing commas are
+    tolerated. When the model answers with plain text and the target model has a single string
+    field, the text is used as the value of that field if it is a short single line without a
+    colon, so prose like "Sure, here is the tag: rock" is rejected. For a single Literal field,
+    the text is only used if it is one of the allowed values.
+
+    Attributes:
+        node (str): Name of the graph node the parser belongs to. Used for parse metrics.
+    """
+    node: str = ""
+
+    def parse_result(self, result, *, partial=False):
+        return self.parse(result[0].text)
+
+    def parse(self, text):
+        try:
+            obj, repaired = extract_json(text)
+        except ValueError as e:
+            obj = self._plain_text_object(text)
+            if obj is None:
+                _record(self.node, "failed")
+                raise OutputParserException(f"Failed to parse {self.pydantic_object.__name__}: {e}", llm_output=text)
+            repaired = True
+
+        try:
+            parsed = self.pydantic_object.model_validate(obj)
+        except ValidationError as e:
+            _record(self.node, "failed")
+            raise OutputParserException(f"Failed to parse {self.pydantic_object.__name__}: {e}", llm_output=text)
+
+        _record(self.node, "repaired" if repaired else "parsed")
+        return parsed
+
+    def _plain_text_object(self, text):
+        """Wraps plain text into the single string field of the target model if possible."""
+        fields = self.pydantic_object.model_fields
+        value = text.strip().strip("`\"'").strip()
+        if len(fields) != 1 or not value or "{" in value:
+            return None
+        field_name, field = next(iter(fields.items()))
+        if get_origin(field.annotation) is Literal:
+            return {field_name: value} if value in get_args(field.annotation) else None
+        if field.annotation is not str:
+            return None
+        if "\n" in value or ":" in value or len(value.split()) > MAX_PLAIN_TEXT_WORDS:
+            return None # Looks like an explanation rather than a bare value.
+        return {field_name: value}
+
+
+def get_parse_metrics():
+    """
+    Returns a snapshot of per-node parse metrics.
+
+    Returns:
+        metrics (dict): Node names mapped to their "parsed", "repaired" and "failed" counters and
+            their "failure_rate".
+    """
+    with _metrics_lock:
+        snapshot = {}
+        for node, node_metrics in _metrics.items():
+            total = sum(node_metrics.values())
+            snapshot[node] = dict(node_metrics, failure_rate=node_metrics["failed"] / total if total else 0.0)
+        return snapshot
@@ -1,6 +1,8 @@
 from typing import TypedDict
 
 # State object for LangGraph to handle the flow.
+# Nodes store plain values, not the pydantic objects of their parsers, so checkpoints only hold
+# types the checkpoint serializer allows.
 class GraphState(TypedDict):
     """
     Represents the state of a graph.
@@ -12,6 +14,7 @@ class GraphState(TypedDict):
         search_function: Chosen search function to use.
         search_query: Search query to search.
         music_tag: Music tag to search.
+        degraded: Whether the search function fell back to plain Spotify search.
     """
     input: str
     description: str
@@ -19,4 +22,5 @@ class GraphState(TypedDict):
     playlist_name: str
     search_function: str
     search_query: str
-    music_tag: str
\ No newline at end of file
+    music_tag: str
+    degraded: bool
\ No newline at end of file
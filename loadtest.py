@@ -0,0 +1,344 @@
+"""
+Load test for the HeyDJ Streamlit app.
+
+Runs the playlist generation pipeline of main.py (playlist info, search, ordering and track details)
+in concurrent threads against stubbed upstreams (Groq, Spotify, Genius and Last.fm), ramping the
+number of concurrent sessions. Groq is stubbed at the HTTP layer, so the real LangGraph workflow,
+output parsing and caching run. The Streamlit UI itself isn't driven: AppTest keeps a process wide
+runtime, so several app instances can't run side by side in one process. For each concurrency level it reports
+throughput, latency percentiles and memory per session, then the saturation point. Results are
+appended to a JSON Lines file together with the git commit, so runs of different versions can be
+compared.
+
+Usage:
+    python loadtest.py --levels 1 2 4 8 16 --rounds 3 --llm-latency 0.3 --api-latency 0.05
+"""
+import argparse
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+# Dummy credentials, the upstream clients are replaced with stubs below.
+for name in ("GROQ_API_KEY", "SPOTIPY_CLIENT_ID", "SPOTIPY_CLIENT_SECRET", "GENIUS_ACCESS_TOKEN", "LASTFM_API_KEY"):
+    os.environ.setdefault(name, "loadtest")
+os.environ.setdefault("SPOTIPY_REDIRECT_URI", "http://localhost:8501/callback")
+data_dir = tempfile.mkdtemp()
+os.environ.setdefault("CACHE_PATH", os.path.join(data_dir, "cache.db"))
+
+import httpx
+import numpy as np
+
+import graph.models
+import pipeline
+import spotify
+from graph.models import get_llm_metrics
+from graph.parsers import get_parse_metrics
+from playlist_ordering import fetch_limit, order_tracks
+from resilience import REQUEST_DEADLINE, get_breaker_health, request_deadline
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SEARCH_FUNCTIONS = ["search_songs", "search_songs_by_lyrics", "search_songs_by_tag"]
+
+
+def _digest(*parts):
+    """Returns a short stable hash of the given parts. Used to generate deterministic fake data."""
+    return hashlib.md5(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:12]
+
+
+class FakeSpotify:
+    """
+    Stand-in for the spotipy client with a fixed latency per call.
+    Attributes:
+        latency (float): Seconds each API call takes.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+
+    def search(self, q="", type="track", limit=10, offset=0):
+        time.sleep(self.latency)
+        return {"tracks": {"items": [{"uri": f"spotify:track:{_digest(q, offset + i)}"} for i in range(limit)]}}
+
+    def tracks(self, tracks, market=None):
+        time.sleep(self.latency)
+        items = []
+        for uri in tracks:
+            track_id = uri.rsplit(":", 1)[-1]
+            items.append({
+                "id": track_id,
+                "uri": uri,
+                "name": f"Track {track_id}",
+                "artists": [{"id": track_id[:4], "name": f"Artist {track_id[:4]}"}],
+                "album": {"images": [{"url": f"https://i.scdn.co/image/{track_id}"}]},
+            })
+        return {"tracks": items}
+
+    def audio_features(self, tracks):
+        time.sleep(self.latency)
+        features = []
+        for uri in tracks:
+            seed = int(_digest(uri), 16)
+            features.append({
+                "energy": seed % 100 / 100,
+                "tempo": 60 + seed % 120,
+                "valence": seed // 100 % 100 / 100,
+                "danceability": seed // 10000 % 100 / 100,
+                "acousticness": seed // 1000000 % 100 / 100,
+                "loudness": -(seed % 30),
+            })
+        return features
+
+    def current_user(self):
+        time.sleep(self.latency)
+        return {"id": "loadtest", "display_name": "Load Test"}
+
+
+class FakeGenius:
+    """
+    Stand-in for the lyricsgenius client with a fixed latency per call.
+    Attributes:
+        latency (float): Seconds each API call takes.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+
+    def search(self, lyrics, per_page=20, page=1):
+        time.sleep(self.latency)
+        return {"hits": [
+            {"result": {"artist_names": f"Artist {_digest(lyrics, page, i)}", "title": f"Song {i}"}}
+            for i in range(per_page)
+        ]}
+
+
+class FakeResponse:
+    """Minimal requests.Response stand-in."""
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeRequests:
+    """
+    Stand-in for the requests module, answering Last.fm tag.gettoptracks calls.
+    Attributes:
+        latency (float): Seconds each request takes.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+
+    def get(self, url, **kwargs):
+        time.sleep(self.latency)
+        params = parse_qs(urlparse(url).query)
+        tag = params.get("tag", [""])[0]
+        limit = int(params.get("limit", ["50"])[0])
+        tracks = [{"artist": {"name": f"Artist {_digest(tag, i)}"}, "name": f"Song {i}"} for i in range(limit)]
+        return FakeResponse({"tracks": {"track": tracks}})
+
+
+class FakeGroq:
+    """
+    httpx transport handler answering Groq chat completion requests with the JSON object each graph
+    node asks for, after a fixed latency.
+    Attributes:
+        latency (float): Seconds each completion takes.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+
+    def __call__(self, request):
+        time.sleep(self.latency)
+        body = json.loads(request.content)
+        prompt = body["messages"][-1]["content"]
+        if "search_function" in prompt:
+            output = {"search_function": SEARCH_FUNCTIONS[int(_digest(prompt), 16) % len(SEARCH_FUNCTIONS)]}
+        elif '"description"' in prompt:
+            output = {"description": f"A playlist made for you, {_digest(prompt)}."}
+        elif '"playlist_name"' in prompt:
+            output = {"playlist_name": f"Mix {_digest(prompt)}"}
+        else:
+            output = {"search_query": f"query {_digest(prompt)}"}
+        return httpx.Response(200, json={
+            "id": f"chatcmpl-{_digest(prompt)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(output)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": 10, "total_tokens": len(prompt.split()) + 10},
+        })
+
+
+def install_stubs(llm_latency, api_latency):
+    """Replaces all upstream clients used by the pipeline with in-process stubs."""
+    # The graph nodes build their Groq clients with this HTTP client on import, so it has to be
+    # replaced before graph.compiler is imported.
+    graph.models.http_client = httpx.Client(transport=httpx.MockTransport(FakeGroq(llm_latency)))
+    importlib.import_module("graph.compiler")
+    spotify.sp = FakeSpotify(api_latency)
+    spotify.genius = FakeGenius(api_latency)
+    spotify.requests = FakeRequests(api_latency)
+
+
+def run_session(user_input, limit):
+    """
+    Runs one user session the way main.py does when the user clicks "Generate Playlist".
+
+    Attributes:
+        user_input (str): Playlist idea entered by the simulated user.
+        limit (int): Number of tracks selected by the simulated user.
+
+    Returns:
+        tuple: Session latency in seconds (float) and whether the session succeeded (bool).
+    """
+    start = time.perf_counter()
+    try:
+        with request_deadline(REQUEST_DEADLINE):
+            playlist_info = graph.compiler.playlist_info_generator(user_input)
+            search_results = pipeline.get_search_results(playlist_info, fetch_limit(limit))
+            search_results = order_tracks(search_results, limit)
+            playlist_df = pipeline.generate_playlist_dataframe(search_results)
+        succeeded = len(playlist_df) > 0
+    except Exception:
+        succeeded = False
+    return time.perf_counter() - start, succeeded
+
+
+def run_level(concurrency, rounds, limit, input_counter, reuse_inputs):
+    """
+    Runs concurrency * rounds sessions with the given number of concurrent sessions.
+
+    Returns:
+        dict: Throughput, latency percentiles, error count and memory per session of the level.
+    """
+    def next_input():
+        index = next(input_counter) % concurrency if reuse_inputs else next(input_counter)
+        return f"songs for load test session {index}"
+
+    session_count = concurrency * rounds
+    tracemalloc.reset_peak()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_session, next_input(), limit) for _ in range(session_count)]
+        outcomes = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    memory_peak = tracemalloc.get_traced_memory()[1]
+
+    latencies = np.array([latency for latency, succeeded in outcomes if succeeded])
+    errors = sum(1 for _, succeeded in outcomes if not succeeded)
+    percentiles = np.percentile(latencies, [50, 95, 99]) if latencies.size else [float("nan")] * 3
+    return {
+        "concurrency": concurrency,
+        "sessions": session_count,
+        "errors": errors,
+        "throughput": (session_count - errors) / elapsed,
+        "latency_p50": float(percentiles[0]),
+        "latency_p95": float(percentiles[1]),
+        "latency_p99": float(percentiles[2]),
+        "memory_per_session_kb": (memory_peak - memory_before) / concurrency / 1024,
+    }
+
+
+def find_saturation_point(levels, latency_slo, min_gain=0.1):
+    """
+    Returns the concurrency at which the app saturates, or None if it didn't saturate.
+
+    The app is saturated at the first level where throughput grows less than min_gain relative to
+    the best previous level, where p95 latency exceeds latency_slo, or where sessions fail.
+    """
+    best_throughput = 0.0
+    for level in levels:
+        saturated = (
+            level["errors"] > 0
+            or level["latency_p95"] > latency_slo
+            or (best_throughput and level["throughput"] < best_throughput * (1 + min_gain))
+        )
+        if saturated:
+            return level["concurrency"]
+        best_throughput = max(best_throughput, level["throughput"])
+    return None
+
+
+def git_version():
+    """Returns the current git commit of the app, or "unknown" outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=APP_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HeyDJ Streamlit app with simulated concurrent users.")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="Concurrent session counts to ramp through.")
+    parser.add_argument("--rounds", type=int, default=3, help="Sessions per concurrent user at each level.")
+    parser.add_argument("--limit", type=int, default=15, help="Number of tracks each session requests.")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds each stubbed Groq completion takes.")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Seconds each stubbed Spotify, Genius or Last.fm call takes.")
+    parser.add_argument("--latency-slo", type=float, default=10.0, help="p95 session latency in seconds above which the app counts as saturated.")
+    parser.add_argument("--reuse-inputs", action="store_true", help="Repeat the same inputs across rounds to measure the warm path.")
+    parser.add_argument("--output", default="loadtest_results.jsonl", help="JSON Lines file the results are appended to.")
+    args = parser.parse_args()
+
+    try:
+        run(args)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def run(args):
+    """Ramps through the concurrency levels of the parsed arguments and appends the results."""
+    install_stubs(args.llm_latency, args.api_latency)
+    tracemalloc.start()
+    input_counter = itertools.count()
+
+    levels = []
+    print(f"{'users':>6} {'sessions':>8} {'errors':>6} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'KB/session':>10}")
+    for concurrency in args.levels:
+        level = run_level(concurrency, args.rounds, args.limit, input_counter, args.reuse_inputs)
+        levels.append(level)
+        print(
+            f"{level['concurrency']:>6} {level['sessions']:>8} {level['errors']:>6} {level['throughput']:>7.2f} "
+            f"{level['latency_p50']:>7.2f} {level['latency_p95']:>7.2f} {level['latency_p99']:>7.2f} "
+            f"{level['memory_per_session_kb']:>10.1f}"
+        )
+    tracemalloc.stop()
+
+    saturation_point = find_saturation_point(levels, args.latency_slo)
+    print(f"Saturation point: {saturation_point if saturation_point else 'not reached'} concurrent users")
+
+    result = {
+        "version": git_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "levels": levels,
+        "saturation_point": saturation_point,
+        "breaker_health": get_breaker_health(),
+        "llm_metrics": get_llm_metrics(),
+        "parse_metrics": get_parse_metrics(),
+    }
+    with open(args.output, "a", encoding="utf-8") as file:
+        file.write(json.dumps(result) + "\n")
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
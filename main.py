@@ -1,66 +1,14 @@
 import spotipy
-from graph.compiler import playlist_info_generator
-from spotify import search_songs, search_songs_by_lyrics, search_songs_by_tag, create_playlist, sp, get_spotify_oauth
+from graph.compiler import playlist_info_generator, forget_playlist_info
+from graph.models import get_llm_metrics
+from graph.parsers import get_parse_metrics
+from pipeline import get_search_results, generate_playlist_dataframe
+from playlist_ordering import fetch_limit, order_tracks
+from resilience import REQUEST_DEADLINE, UpstreamUnavailable, get_breaker_health, request_deadline
+from spotify import create_playlist, sp, get_spotify_oauth
 import pandas as pd
 import streamlit as st
-
-def get_search_results(playlist_info, limit):
-    """
-    Retrieves search results for songs based on the LLM generated search method and query.
-
-    Attributes:
-        playlist_info (dict): Contains the search parameters, including:
-            - search_query (str): The query string for the search.
-            - search_function (str): Specifies the type of search. Possible values:
-                - 'search_songs': Search by song titles.
-                - 'search_songs_by_lyrics': Search by lyrics.
-                - 'search_songs_by_tag': Search by tags.
-        limit (int): The maximum number of search results to return.
-
-    Returns:
-        search_results (list): The track URI'S obtained from the specified search method.
-    """
-    search_query = playlist_info['search_query']
-    search_function = playlist_info['search_function']
-    if search_function == 'search_songs':
-        search_results = search_songs(query=search_query, limit=limit)
-    elif search_function == 'search_songs_by_lyrics':
-        search_results = search_songs_by_lyrics(query=search_query, limit=limit)
-    elif search_function == 'search_songs_by_tag':
-        search_results = search_songs_by_tag(query=search_query, limit=limit)
-    return search_results
-
-
-def generate_playlist_dataframe(search_results):
-    """
-    Creates a pandas DataFrame containing playlist details from track URI's.
-
-    Attributes:
-        search_results (list): A list of track URIs retrieved from a search.
-    Returns:
-        df (pd.DataFrame): A DataFrame with the following columns:
-            - Track No: The track's position in the playlist (starting from 1).
-            - Album Image: HTML code displaying the album's cover image.
-            - Track Name: The name of the track.
-            - Artist Name: The name(s) of the artist(s), separated by commas.
-    """
-    track_data = []
-    for uri in search_results:
-        track = sp.track(uri)  # Fetches track details from Spotify's API.
-        track_name = track['name']
-        artist_name = ', '.join(artist['name'] for artist in track['artists'])
-        album_image = track['album']['images'][0]['url'] if track['album']['images'] else None
-        album_image_html = f'<img src="{album_image}" width="60">' if album_image else "No Image"
-
-        track_data.append({
-            "Album Image": album_image_html,
-            "Track Name": track_name,
-            "Artist Name": artist_name,
-        })
-
-    df = pd.DataFrame(track_data)
-    df.insert(0, "Track No", range(1, len(df) + 1))
-    return df
+import uuid
 
 ## STREAMLIT
 
@@ -94,6 +42,8 @@ if 'playlist_generated' not in st.session_state:
     st.session_state.playlist_df = None
 if 'token_info' not in st.session_state:
     st.session_state.token_info = None
+if 'graph_thread_id' not in st.session_state:
+    st.session_state.graph_thread_id = str(uuid.uuid4()) # Checkpoint thread of the LLM workflow for this session.
 
 # When the "Generate Playlist" button is clicked, the following block of code is executed
 if st.button(label="▷ Generate Playlist", use_container_width=True):
@@ -101,26 +51,60 @@ if st.button(label="▷ Generate Playlist", use_container_width=True):
     progress_bar = st.progress(0)
     status_text = st.empty() # Placeholder
 
-    # Step 1: Generate playlist title and description
-    status_text.text("Generating playlist title and description...")
-    playlist_info = playlist_info_generator(user_input) # LLM generated playlist info dictionary.
-    st.session_state.playlist_generated = True # Update the streamlit state
+    # Discard the previous playlist, so a failed step can't leave its tracks behind for "Add to Spotify".
+    st.session_state.playlist_generated = False
+    st.session_state.playlist_info = None
+    st.session_state.search_results = None
+    st.session_state.playlist_df = None
+
+    # Generation and search run under a deadline, so slow upstream services can't stall the request indefinitely.
+    with request_deadline(REQUEST_DEADLINE):
+        # Step 1: Generate playlist title and description
+        status_text.text("Generating playlist title and description...")
+        try:
+            playlist_info = playlist_info_generator(user_input, thread_id=st.session_state.graph_thread_id) # LLM generated playlist info dictionary.
+        except Exception as e:
+            # Completed steps are checkpointed, so generating again only re-runs the failed step.
+            progress_bar.empty()
+            status_text.empty()
+            st.error(f"Playlist generation failed, please try again: {e}")
+            st.stop()
+        progress_bar.progress(50) # Update progress bar to indicate 50% completion
+
+        # Step 2: Search for songs based on the generated playlist information
+        status_text.text("Searching for songs...")
+        try:
+            search_results = get_search_results(playlist_info, fetch_limit(limit)) # Extra tracks replace the ones filtered out while ordering.
+        except UpstreamUnavailable as e:
+            progress_bar.empty()
+            status_text.empty()
+            st.error(f"Music services are unavailable right now, please try again later: {e}")
+            st.stop()
+
+        # Step 3: Order the tracks and fetch their details. Both are cut short when the deadline passes.
+        status_text.text("Ordering tracks...")
+        try:
+            search_results = order_tracks(search_results, limit)
+            playlist_df = generate_playlist_dataframe(search_results)
+        except UpstreamUnavailable as e:
+            progress_bar.empty()
+            status_text.empty()
+            st.error(f"Spotify is unavailable right now, please try again later: {e}")
+            st.stop()
+    # Update the streamlit state only once every step succeeded.
+    st.session_state.playlist_generated = True
     st.session_state.playlist_info = playlist_info
-    progress_bar.progress(50) # Update progress bar to indicate 50% completion
-
-    # Step 2: Search for songs based on the generated playlist information
-    status_text.text("Searching for songs...")
-    search_results = get_search_results(playlist_info, limit)
-    playlist_df = generate_playlist_dataframe(search_results)
-    st.session_state.search_results = search_results # Update the streamlit state
-    st.session_state.playlist_df = playlist_df # Update the streamlit state
+    st.session_state.search_results = search_results
+    st.session_state.playlist_df = playlist_df
     progress_bar.progress(100) # Update progress bar to indicate 100% completion
 
-    # Step 3: Clear progress bar and display final status
+    # Step 4: Clear progress bar and display final status
     progress_bar.empty() # Remove the progress bar
     status_text.text("Here is the playlist:")
 
     # Display the generated playlist information
+    if playlist_info.get('degraded'):
+        st.info("Lyric and tag search is temporarily unavailable, so this playlist is based on a Spotify search.")
     st.subheader(f"Playlist Name: {playlist_info['playlist_name']}", divider=True)
     st.subheader("Description")
     st.write(playlist_info['description'], divider=True)
@@ -149,6 +133,8 @@ if st.session_state.playlist_generated:
 
     # Right column: 'Cancel' button functionality
     if right.button(label="Cancel", use_container_width=True):
+        # Forget the cached playlist info, so generating again with the same input creates a new one.
+        forget_playlist_info(st.session_state.playlist_info['input'])
         # Reset session state variables to their initial state (no playlist)
         st.session_state.playlist_generated = False
         st.session_state.playlist_info = None
@@ -191,4 +177,24 @@ with st.sidebar:
             st.write(f"**Name:** {user_info['display_name']}")
             st.write(f"**Spotify ID:** {user_info['id']}")
         except Exception as e:
-            st.error(f"Authentication failed: {e}")
\ No newline at end of file
+            st.error(f"Authentication failed: {e}")
+
+    # Health of the upstream services, as reported by their circuit breakers.
+    with st.expander("Service Health"):
+        st.dataframe(pd.DataFrame(get_breaker_health()).T, use_container_width=True)
+
+        # Token usage and latency of each LLM node, to tune model tiers and token caps.
+        llm_metrics = get_llm_metrics()
+        if llm_metrics:
+            st.write("**LLM Usage**")
+            llm_metrics_df = pd.DataFrame(llm_metrics).T
+            llm_metrics_df["models"] = llm_metrics_df["models"].apply(
+                lambda models: ", ".join(f"{model}: {calls}" for model, calls in models.items())
+            )
+            st.dataframe(llm_metrics_df, use_container_width=True)
+
+        # Parse outcomes of each LLM node's output.
+        parse_metrics = get_parse_metrics()
+        if parse_metrics:
+            st.write("**LLM Output Parsing**")
+            st.dataframe(pd.DataFrame(parse_metrics).T, use_container_width=True)
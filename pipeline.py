@@ -0,0 +1,114 @@
+from playlist_store import playlist_store
+from resilience import UpstreamUnavailable, deadline_exceeded
+from spotify import search_songs, get_lyric_candidates, get_tag_candidates, resolve_candidates, get_tracks
+import logging
+import pandas as pd
+
+# Playlist generation steps used by the Streamlit app (main.py) and the load test (loadtest.py).
+
+logger = logging.getLogger(__name__)
+
+
+def get_search_results(playlist_info, limit):
+    """
+    Retrieves search results for songs based on the LLM generated search method and query.
+
+    Search progress is kept in the playlist store. When the same search was run before, its results
+    are reused and a larger limit only resolves the songs that weren't resolved yet. When Genius or
+    Last.fm is unavailable, the stored songs are used and the rest is filled by a plain Spotify search.
+    Resolution stops when the request's deadline passes or Spotify fails, keeping the progress made.
+
+    Attributes:
+        playlist_info (dict): Contains the search parameters, including:
+            - search_query (str): The query string for the search.
+            - search_function (str): Specifies the type of search. Possible values:
+                - 'search_songs': Search by song titles.
+                - 'search_songs_by_lyrics': Search by lyrics.
+                - 'search_songs_by_tag': Search by tags.
+        limit (int): The maximum number of search results to return.
+
+    Returns:
+        search_results (list): The track URI'S obtained from the specified search method.
+
+    Raises:
+        UpstreamUnavailable: If no track could be found because the music services are unavailable.
+    """
+    search_query = playlist_info['search_query']
+    search_function = playlist_info['search_function']
+    search = playlist_store.get_search(search_function, search_query)
+    track_uris = search['track_uris']
+    if len(track_uris) >= limit:
+        return track_uris[:limit]
+
+    missing = limit - len(track_uris)
+    upstream_unavailable = False
+    resolution_error = None
+    if search_function == 'search_songs':
+        track_uris.extend(search_songs(query=search_query, limit=missing, offset=len(track_uris)))
+    else:
+        candidates = search['candidates']
+        cursor = search['cursor']
+        if len(candidates) < cursor + missing:
+            # Fetch a longer ranking and append the songs that aren't in the stored one yet.
+            get_candidates = get_lyric_candidates if search_function == 'search_songs_by_lyrics' else get_tag_candidates
+            try:
+                for song in get_candidates(query=search_query, limit=cursor + missing):
+                    if song not in candidates:
+                        candidates.append(song)
+            except UpstreamUnavailable as e:
+                logger.warning("Falling back to Spotify search for %r: %s", search_query, e)
+                upstream_unavailable = True
+        for song in candidates[cursor:cursor + missing]:
+            try:
+                track_uris.extend(resolve_candidates([song], query=search_query))
+            except UpstreamUnavailable as e:
+                # Out of time or Spotify failed, the remaining songs are resolved by the next request.
+                logger.warning("Stopped resolving songs for %r after %d of them: %s", search_query, search['cursor'] - cursor, e)
+                resolution_error = e
+                break
+            search['cursor'] += 1
+
+    playlist_store.save_search(search_function, search_query, search)
+    search_results = track_uris[:limit]
+    if resolution_error and not search_results:
+        raise resolution_error
+    if upstream_unavailable and len(search_results) < limit and not deadline_exceeded():
+        # Fill-up tracks aren't stored, the next search should use the intended source again.
+        for uri in search_songs(query=search_query, limit=limit - len(search_results)):
+            if uri not in search_results:
+                search_results.append(uri)
+    return search_results
+
+
+def generate_playlist_dataframe(search_results):
+    """
+    Creates a pandas DataFrame containing playlist details from track URI's.
+
+    Attributes:
+        search_results (list): A list of track URIs retrieved from a search.
+    Returns:
+        df (pd.DataFrame): A DataFrame with the following columns:
+            - Track No: The track's position in the playlist (starting from 1).
+            - Album Image: HTML code displaying the album's cover image.
+            - Track Name: The name of the track.
+            - Artist Name: The name(s) of the artist(s), separated by commas.
+    """
+    tracks = get_tracks(search_results)  # Fetches track details from the cache or Spotify's API.
+    track_data = []
+    for uri in search_results:
+        # Tracks not fetched before the deadline are still added to the playlist, only their details are missing.
+        track = tracks.get(uri, {"name": "Details unavailable", "artists": [], "album_image": None})
+        track_name = track['name']
+        artist_name = ', '.join(artist['name'] for artist in track['artists'])
+        album_image = track['album_image']
+        album_image_html = f'<img src="{album_image}" width="60">' if album_image else "No Image"
+
+        track_data.append({
+            "Album Image": album_image_html,
+            "Track Name": track_name,
+            "Artist Name": artist_name,
+        })
+
+    df = pd.DataFrame(track_data)
+    df.insert(0, "Track No", range(1, len(df) + 1))
+    return df
@@ -0,0 +1,129 @@
+from spotify import AUDIO_FEATURE_FIELDS, get_audio_features, get_tracks
+import math
+import numpy as np
+
+OVERFETCH_RATIO = 0.2 # Extra share of tracks searched for, so removed outliers and duplicates can be replaced.
+OUTLIER_THRESHOLD = 3.0 # Robust z-score above which a track is an outlier.
+ARTIST_GAP = 3 # Number of preceding tracks checked for the same artist.
+ARTIST_PENALTY = 10.0 # Cost of placing a track within ARTIST_GAP tracks of the same artist.
+RANK_WEIGHT = 1.0 # Cost of moving a track away from its search rank.
+
+# Weight of each audio feature in transition smoothness. Energy and tempo dominate.
+FEATURE_WEIGHTS = np.array([
+    {"energy": 1.0, "tempo": 1.0, "valence": 0.5, "danceability": 0.5, "acousticness": 0.5, "loudness": 0.25}[field]
+    for field in AUDIO_FEATURE_FIELDS
+])
+
+
+def fetch_limit(limit):
+    """Returns the number of tracks to search for to end up with limit ordered tracks."""
+    return limit + math.ceil(limit * OVERFETCH_RATIO)
+
+
+def _scale(matrix, center, spread):
+    """
+    Scales feature columns. Columns without spread are set to zero instead of dividing by zero,
+    e.g. a column where most tracks share a tempo has a MAD of zero even if a few tracks differ.
+    """
+    safe_spread = np.where(spread > 0, spread, 1.0)
+    return np.where(spread > 0, (matrix - center) / safe_spread, 0.0)
+
+
+def remove_outliers(matrix, keep):
+    """
+    Flags tracks whose audio features are far from the rest of the playlist.
+
+    Attributes:
+        matrix (np.ndarray): Audio features, one row per track.
+        keep (int): Minimum number of tracks to keep. The least outlying tracks are kept if fewer
+            tracks pass the threshold.
+
+    Returns:
+        mask (np.ndarray): Boolean mask of the tracks to keep.
+    """
+    median = np.median(matrix, axis=0)
+    mad = np.median(np.abs(matrix - median), axis=0) * 1.4826 # Scaled to match the standard deviation.
+    scores = np.abs(_scale(matrix, median, mad)).max(axis=1)
+    mask = scores <= OUTLIER_THRESHOLD
+    if mask.sum() < keep:
+        mask = np.zeros(len(scores), dtype=bool)
+        mask[np.argsort(scores, kind="stable")[:keep]] = True
+    return mask
+
+
+def sequence_tracks(matrix, artists):
+    """
+    Orders tracks so consecutive tracks sound alike, songs of an artist are spread out and tracks
+    stay close to their search rank. Starts with the first track and greedily appends the track
+    with the lowest transition cost.
+
+    Attributes:
+        matrix (np.ndarray): Audio features, one row per track in search rank order.
+        artists (list): Artist IDs of each track.
+
+    Returns:
+        order (list): Track indices in playlist order.
+    """
+    track_count = len(matrix)
+    scaled = _scale(matrix, matrix.mean(axis=0), matrix.std(axis=0)) * np.sqrt(FEATURE_WEIGHTS[:matrix.shape[1]])
+    distances = np.sqrt(((scaled[:, None, :] - scaled[None, :, :]) ** 2).sum(axis=2))
+    ranks = np.arange(track_count) / max(track_count - 1, 1)
+
+    # Tracks sharing at least one artist, computed from a track-artist incidence matrix.
+    artist_index = {artist: index for index, artist in enumerate({artist for track in artists for artist in track})}
+    incidence = np.zeros((track_count, len(artist_index)))
+    for track, track_artists in enumerate(artists):
+        incidence[track, [artist_index[artist] for artist in track_artists]] = 1
+    same_artist = (incidence @ incidence.T) > 0
+
+    order = [0]
+    remaining = np.ones(track_count, dtype=bool)
+    remaining[0] = False
+    while remaining.any():
+        cost = distances[order[-1]] + RANK_WEIGHT * ranks + ARTIST_PENALTY * same_artist[order[-ARTIST_GAP:]].any(axis=0)
+        cost[~remaining] = np.inf
+        next_track = int(np.argmin(cost))
+        order.append(next_track)
+        remaining[next_track] = False
+    return order
+
+
+def order_tracks(track_uris, limit):
+    """
+    Filters and orders search results into a coherent playlist.
+
+    Duplicate tracks and audio feature outliers are removed, then the tracks are sequenced for
+    smooth energy and tempo transitions with songs of the same artist spread out. Tracks without
+    audio features are kept after the ordered ones. When audio features are unavailable, only
+    duplicates are removed and artists are spread out. When the request's deadline passes, the
+    tracks are ordered with the features and artists fetched so far.
+
+    Attributes:
+        track_uris (list): Track URIs in search rank order, ideally fetch_limit(limit) of them.
+        limit (int): Number of tracks in the playlist.
+
+    Returns:
+        track_uris (list): At most limit track URIs in playlist order.
+    """
+    uris = list(dict.fromkeys(track_uris))
+    if len(uris) < 2:
+        return uris[:limit]
+
+    features = get_audio_features(uris)
+    if len(features) >= 3:
+        scored = [uri for uri in uris if uri in features]
+        unscored = [uri for uri in uris if uri not in features]
+        matrix = np.array([[features[uri][field] for field in AUDIO_FEATURE_FIELDS] for uri in scored], dtype=float)
+        mask = remove_outliers(matrix, min(limit, len(scored)))
+        scored = [uri for uri, keep in zip(scored, mask) if keep][:limit]
+        matrix = matrix[mask][:limit]
+        unscored = unscored[:limit - len(scored)]
+    else:
+        scored = uris[:limit]
+        unscored = []
+        matrix = np.zeros((len(scored), 1))
+
+    tracks = get_tracks(scored) # Tracks missing after the deadline are ordered without their artists.
+    artists = [[artist['id'] for artist in tracks[uri]['artists']] if uri in tracks else [] for uri in scored]
+    ordered = [scored[index] for index in sequence_tracks(matrix, artists)]
+    return ordered + unscored
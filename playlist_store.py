@@ -0,0 +1,52 @@
+from cache import SEARCH, TTLS, cache_key, get_cache, normalize_text
+
+
+class PlaylistStore:
+    """
+    Store of search progress, kept in the shared cache so all replicas continue the same searches.
+
+    Progress is keyed by search function and normalized search query. It holds the ranked
+    candidate songs, the resolution cursor (number of candidates already resolved) and the
+    resolved track URIs, so a larger playlist continues from where the last search stopped.
+    Generated playlist info is cached by the LLM workflow itself (see
+    graph.compiler.playlist_info_generator).
+
+    Attributes:
+        cache (CacheBackend): Cache the progress is kept in (default: the backend of get_cache).
+    """
+    def __init__(self, cache=None):
+        self._cache = cache
+
+    @property
+    def cache(self):
+        return self._cache if self._cache is not None else get_cache()
+
+    @staticmethod
+    def search_key(search_function="", search_query=""):
+        """Returns the cache key of a search."""
+        return cache_key(SEARCH, search_function, normalize_text(search_query))
+
+    def get_search(self, search_function="", search_query=""):
+        """
+        Returns the stored progress of a search.
+
+        Attributes:
+            search_function (str): The search function used.
+            search_query (str): The search query used.
+
+        Returns:
+            dict: A dictionary containing "candidates", "cursor" and "track_uris". Empty progress
+                is returned if the search wasn't run before.
+        """
+        search = self.cache.get(self.search_key(search_function, search_query))
+        if search is None:
+            return {"candidates": [], "cursor": 0, "track_uris": []}
+        return search
+
+    def save_search(self, search_function="", search_query="", search=None):
+        """Stores the progress of a search, as returned by get_search."""
+        self.cache.set(self.search_key(search_function, search_query), search, ttl=TTLS[SEARCH])
+
+
+# Store object shared by all sessions of the app.
+playlist_store = PlaylistStore()
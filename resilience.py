@@ -0,0 +1,215 @@
+from contextlib import contextmanager
+import contextvars
+import os
+import threading
+import time
+
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "30")) # Time budget in seconds of a playlist generation request.
+MIN_CALL_TIMEOUT = 0.1 # Shortest timeout given to an upstream call, HTTP clients reject a timeout of zero.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream service can't be used for a request."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """Raised when an upstream call is rejected because its circuit breaker is open."""
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """Raised when an upstream call is rejected because the request ran out of time."""
+
+
+# Deadline of the current request, as a time.monotonic() value.
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds):
+    """
+    Runs the enclosed block under a deadline. Upstream calls made through a circuit breaker and LLM
+    calls are rejected once the deadline has passed, and their timeouts are capped by the time
+    left, so a request can't take longer than its budget.
+
+    Attributes:
+        seconds (float): Time budget of the request.
+    """
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    """Returns the seconds left until the current request's deadline, or None without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def deadline_exceeded():
+    """Returns whether the current request's deadline has passed."""
+    return remaining_time() == 0.0
+
+
+def check_deadline(step):
+    """
+    Raises DeadlineExceeded if the current request's deadline has passed.
+
+    Attributes:
+        step (str): What was about to be done, used in the error message (e.g. "calling genius").
+    """
+    if deadline_exceeded():
+        raise DeadlineExceeded(f"Deadline exceeded before {step}.")
+
+
+def capped_timeout(timeout):
+    """Returns the timeout of a call made now: the given timeout, capped by the time left until the deadline."""
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    return max(min(timeout, remaining), MIN_CALL_TIMEOUT)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of an upstream service.
+
+    After failure_threshold consecutive failures the breaker opens and rejects calls for
+    reset_timeout seconds. Then a single trial call is let through (half open): the breaker closes
+    if it succeeds and opens again if it fails.
+
+    Attributes:
+        name (str): Name of the upstream service.
+        timeout (float): Timeout in seconds for a single call to the service.
+        failure_threshold (int): Consecutive failures that open the breaker.
+        reset_timeout (float): Seconds the breaker stays open before a trial call.
+    """
+    def __init__(self, name, timeout=5.0, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._counts = {"successes": 0, "failures": 0, "rejections": 0, "deadline_cutoffs": 0}
+
+    @property
+    def state(self):
+        """The current state of the breaker: "closed", "open" or "half_open"."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+            return self._state
+
+    @property
+    def is_open(self):
+        """Whether calls are currently rejected."""
+        return self.state == OPEN
+
+    def _allow(self):
+        """Returns whether a call may go through, reserving the trial call when half open."""
+        state = self.state
+        with self._lock:
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self._counts["rejections"] += 1
+            return False
+
+    def _record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._trial_running = False
+            self._counts["successes"] += 1
+
+    def _record_cutoff(self):
+        """Records a call cut short by the request's deadline. It says nothing about the service's health."""
+        with self._lock:
+            self._trial_running = False
+            self._counts["deadline_cutoffs"] += 1
+
+    def _record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._counts["failures"] += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def call_timeout(self):
+        """Returns the timeout of a call made now, capped by the time left until the request's deadline."""
+        return capped_timeout(self.timeout)
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls an upstream function through the breaker.
+
+        Attributes:
+            function (callable): The function that calls the upstream service. It must enforce
+                call_timeout() itself, e.g. with the timeout argument of requests.
+            args, kwargs: Arguments passed to the function.
+
+        Returns:
+            The return value of the function.
+
+        Raises:
+            DeadlineExceeded: If the current request's deadline has passed, or the call failed after
+                its timeout was cut short by the deadline. Such calls don't count as failures.
+            CircuitOpenError: If the breaker is open.
+            UpstreamUnavailable: If the function raises. The original exception is chained.
+        """
+        check_deadline(f"calling {self.name}")
+        if not self._allow():
+            raise CircuitOpenError(f"{self.name} is unavailable, its circuit breaker is open.")
+        capped = self.call_timeout() < self.timeout
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            if capped and deadline_exceeded():
+                # The call ran out of the request's time budget, not the service's timeout.
+                self._record_cutoff()
+                raise DeadlineExceeded(f"Deadline exceeded while calling {self.name}: {e}") from e
+            self._record_failure()
+            raise UpstreamUnavailable(f"{self.name} request failed: {e}") from e
+        self._record_success()
+        return result
+
+    def health(self):
+        """Returns the state and call counters of the breaker."""
+        state = self.state
+        with self._lock:
+            return dict(self._counts, state=state, consecutive_failures=self._consecutive_failures)
+
+
+# Circuit breakers of the upstream services. Timeouts can be tuned with environment variables.
+breakers = {
+    "genius": CircuitBreaker("genius", timeout=float(os.getenv("GENIUS_TIMEOUT", "5"))),
+    "lastfm": CircuitBreaker("lastfm", timeout=float(os.getenv("LASTFM_TIMEOUT", "5"))),
+    "spotify": CircuitBreaker("spotify", timeout=float(os.getenv("SPOTIFY_TIMEOUT", "5"))),
+}
+
+
+def get_breaker_health():
+    """
+    Returns the health metrics of all upstream services.
+
+    Returns:
+        health (dict): Service names mapped to their breaker state ("closed", "open" or
+            "half_open"), consecutive failures and success, failure, rejection and deadline cutoff
+            counters.
+    """
+    return {name: breaker.health() for name, breaker in breakers.items()}
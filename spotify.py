@@ -1,9 +1,14 @@
+import logging
 import os
 import requests
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
 import lyricsgenius as lg
+from cache import get_cache, cache_key, normalize_text, AUDIO_FEATURES, LYRIC_LIST, RESOLUTION, TAG_LIST, TRACK, TTLS
+from resilience import DeadlineExceeded, UpstreamUnavailable, breakers, capped_timeout
+
+logger = logging.getLogger(__name__)
 
 # Secrets Management
 load_dotenv()
@@ -13,30 +18,62 @@ SP_REDIRECT_URI = os.getenv("SPOTIPY_REDIRECT_URI")
 LG_ACCESS_TOKEN = os.getenv("GENIUS_ACCESS_TOKEN")
 LFM_API_KEY = os.getenv("LASTFM_API_KEY") # LastFm is used for tag related search operations.
 LFM_URL = "http://ws.audioscrobbler.com/2.0/"
+AUDIO_FEATURE_FIELDS = ["energy", "tempo", "valence", "danceability", "acousticness", "loudness"] # Audio features used to order playlists.
+AUDIO_FEATURES_BATCH_SIZE = 100 # Maximum number of tracks per Spotify audio features request.
+AUDIO_FEATURES_RESTRICTED_TTL = 24 * 3600 # Seconds before a restricted audio features endpoint is tried again.
+TRACKS_BATCH_SIZE = 50 # Maximum number of tracks per Spotify tracks request.
 SCOPE = "user-read-private, playlist-modify-private, playlist-modify-public" # Necessary scopes for Spotify API.
 
+class DeadlineSpotify(spotipy.Spotify):
+    """Spotify client whose request timeout is capped by the time left until the request's deadline."""
+    @property
+    def requests_timeout(self):
+        return capped_timeout(self._requests_timeout)
+
+    @requests_timeout.setter
+    def requests_timeout(self, timeout):
+        self._requests_timeout = timeout
+
+
+class DeadlineGenius(lg.Genius):
+    """Genius client whose request timeout is capped by the time left until the request's deadline."""
+    @property
+    def timeout(self):
+        return capped_timeout(self._timeout)
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self._timeout = timeout
+
+
 # Spotify object for Spotify related operations.
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(client_id=SP_CLIENT_ID,
+# Retries are disabled, so a call never takes longer than its timeout. Failures are handled by the circuit breaker.
+sp = DeadlineSpotify(auth_manager=SpotifyOAuth(client_id=SP_CLIENT_ID,
                                                client_secret=SP_CLIENT_SECRET,
                                                redirect_uri=SP_REDIRECT_URI,
-                                               scope=SCOPE))
+                                               scope=SCOPE),
+                     requests_timeout=breakers["spotify"].timeout,
+                     retries=0)
 
 
 # genius object for lyric search functionality.
-genius = lg.Genius(LG_ACCESS_TOKEN, skip_non_songs=True, excluded_terms=["(Remix)", "(Live)", "-", "Remaster"], remove_section_headers=True)
+genius = DeadlineGenius(LG_ACCESS_TOKEN, skip_non_songs=True, excluded_terms=["(Remix)", "(Live)", "-", "Remaster"], remove_section_headers=True,
+                        timeout=breakers["genius"].timeout, retries=0)
 
-def search_songs(query="", limit=25):
+def search_songs(query="", limit=25, offset=0):
     """
     Searches for tracks on Spotify.
 
     Args:
-
+        query (str): The search query (default: "").
+        limit (int): Maximum number of results to return (default: 25).
+        offset (int): Index of the first result to return (default: 0).
 
     Returns:
         list: A list of URIs for the matching tracks.
     """
 
-    results = sp.search(q=query, type="track", limit=limit)
+    results = breakers["spotify"].call(sp.search, q=query, type="track", limit=limit, offset=offset)
 
     track_uris = []
     if 'tracks' in results and 'items' in results['tracks']:
@@ -66,7 +103,7 @@ def search_songs_by_name(artist="", track="", limit=25):
 
     query_string = ", ".join(query)
 
-    results = sp.search(q=query_string, type="track", limit=limit)
+    results = breakers["spotify"].call(sp.search, q=query_string, type="track", limit=limit)
 
     track_uris = []
     if 'tracks' in results and 'items' in results['tracks']:
@@ -77,16 +114,44 @@ def search_songs_by_name(artist="", track="", limit=25):
     return track_uris
 
 
-def search_songs_by_lyrics(query="", limit=25):
+def resolve_candidates(candidates, query=""):
     """
-    Searches for songs based on lyrics and retrieves their URIs.
+    Resolves candidate songs to Spotify track URIs. Resolutions are shared through the cache.
+
+    Attributes:
+        candidates (list): Candidate songs as dictionaries with "artist" and "track" keys.
+        query (str): The original search query. Used when a candidate can't be found on Spotify.
+
+    Returns:
+        track_uris (list): A list of track URIs, in the order of the candidates.
+    """
+    track_uris = []
+    for song in candidates:
+        key = cache_key(RESOLUTION, normalize_text(song['artist']), normalize_text(song['track']))
+        # A resolution is a single search, so replicas don't coordinate through a lock entry.
+        track_uri = get_cache().get_or_set(
+            key, lambda: search_songs_by_name(artist=song['artist'], track=song['track'], limit=1), ttl=TTLS[RESOLUTION],
+            shared_lock=False,
+        )
+        if not track_uri:
+            track_uri = search_songs(query=query, limit=1)
+        track_uris.extend(track_uri)
+    return track_uris
+
+
+def get_lyric_candidates(query="", limit=25):
+    """
+    Searches Genius for songs based on lyrics.
 
     Attributes:
         query (str): The lyrics or part of the lyrics to search for.
-        limit (int): The maximum number of song URIs to return.
+        limit (int): The maximum number of songs to return.
 
     Returns:
-        track_uris (list): A list of track URIs corresponding to the found songs.
+        tracks (list): Ranked candidate songs as dictionaries with "artist" and "track" keys.
+
+    Raises:
+        UpstreamUnavailable: If Genius fails or its circuit breaker is open.
     """
     def get_song_info(data):
         """Extracts song details (artist and track name) from the search result data."""
@@ -101,33 +166,74 @@ def search_songs_by_lyrics(query="", limit=25):
 
 
     # Genius API only allows 20 result per page. This part fetch song details across multiple pages if necessary.
+    # Page size is fixed so a larger limit extends the same ranking instead of reshuffling it.
     def fetch_song_info_by_page(lyrics, per_page, page):
-        """Fetches song information from a specific page of the search results."""
-        search_result = genius.search(lyrics, per_page=per_page, page=page)
-        return get_song_info(search_result)
+        """Fetches song information from a specific page of the search results. Pages are shared through the cache."""
+        def fetch_page():
+            search_result = breakers["genius"].call(genius.search, lyrics, per_page=per_page, page=page)
+            return get_song_info(search_result)
+        return get_cache().get_or_set(cache_key(LYRIC_LIST, normalize_text(lyrics), per_page, page), fetch_page, ttl=TTLS[LYRIC_LIST])
 
     tracks = []
-    track_uris = []
     remaining_limit = limit
     page = 1
 
     while remaining_limit > 0:
-        per_page = min(remaining_limit, 20)
-        tracks.extend(fetch_song_info_by_page(query, per_page, page))
-        remaining_limit -= per_page
+        tracks.extend(fetch_song_info_by_page(query, 20, page))
+        remaining_limit -= 20
         page += 1
 
-    for track in tracks:
-        artist = track['artist']
-        track_name = track['track']
-        track_uri = search_songs_by_name(artist=artist, track=track_name, limit=1)
+    return tracks[:limit]
 
-        if not track_uri:
-            track_uri = search_songs(query=query, limit=1)
 
-        track_uris.extend(track_uri)
+def get_tag_candidates(query="", limit=25):
+    """
+    Searches Last.fm for the top songs of a tag.
 
-    return track_uris
+    Attributes:
+        query (str): The tag to search for (e.g., genre, mood).
+        limit (int): The maximum number of songs to return.
+
+    Returns:
+        track_list (list): Ranked candidate songs as dictionaries with "artist" and "track" keys.
+
+    Raises:
+        UpstreamUnavailable: If Last.fm fails or its circuit breaker is open.
+    """
+    fetch_limit = max(limit, 50)
+
+    def request_tag_tracks():
+        """Requests the top tracks of the tag from Last.fm, raising on error responses."""
+        url = f"{LFM_URL}?method=tag.gettoptracks&tag={query}&limit={fetch_limit}&api_key={LFM_API_KEY}&format=json"
+        response = requests.get(url, timeout=breakers["lastfm"].call_timeout())
+        response.raise_for_status()
+        data = response.json()
+        if 'error' in data:
+            raise ValueError(data.get('message', data['error']))
+        return data
+
+    def fetch_tag_tracks():
+        """Fetches the top tracks of the tag from Last.fm. Errors are raised, so they aren't cached."""
+        data = breakers["lastfm"].call(request_tag_tracks)
+        return [{"artist": track['artist']['name'], "track": track['name']} for track in data['tracks']['track']]
+
+    key = cache_key(TAG_LIST, normalize_text(query), fetch_limit)
+    track_list = get_cache().get_or_set(key, fetch_tag_tracks, ttl=TTLS[TAG_LIST])
+    return (track_list or [])[:limit]
+
+
+def search_songs_by_lyrics(query="", limit=25):
+    """
+    Searches for songs based on lyrics and retrieves their URIs.
+
+    Attributes:
+        query (str): The lyrics or part of the lyrics to search for.
+        limit (int): The maximum number of song URIs to return.
+
+    Returns:
+        track_uris (list): A list of track URIs corresponding to the found songs.
+    """
+    return resolve_candidates(get_lyric_candidates(query=query, limit=limit), query=query)
 
 def search_songs_by_tag(query="", limit=25):
     """
@@ -140,30 +246,119 @@ def search_songs_by_tag(query="", limit=25):
     Returns:
         track_uris (list): A list of track URIs corresponding to the found songs.
     """
-    url = f"{LFM_URL}?method=tag.gettoptracks&tag={query}&api_key={LFM_API_KEY}&format=json"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        tracks = data['tracks']['track']
-        track_list = []
-        track_uris = []
-
-        for track in tracks[:limit]:
-            track_info = {"artist": track['artist']['name'], "track": track['name']}
-            track_list.append(track_info)
-
-        for song in track_list:
-            track = song['track']
-            artist = song['artist']
-            track_uri = search_songs_by_name(artist=artist, track=track, limit=1)
-            if not track_uri:
-                track_uri = search_songs(query=query, limit=1)
-            track_uris.extend(track_uri)
-        return track_uris
-
-    else:
-        print("Error occured:", response.status_code)
-        return []
+    return resolve_candidates(get_tag_candidates(query=query, limit=limit), query=query)
+
+
+def get_tracks(uris):
+    """
+    Retrieves the details of tracks in batched requests. Details are shared through the cache, so
+    only tracks that weren't seen before are requested from Spotify.
+
+    Attributes:
+        uris (list): A list of track URIs.
+
+    Returns:
+        tracks (dict): Track URIs mapped to dictionaries containing:
+            - "uri": The track URI.
+            - "name": The track name.
+            - "artists": The track's artists as dictionaries with "id" and "name" keys.
+            - "album_image": URL of the album's cover image, or None.
+        Tracks Spotify doesn't know are left out, as are the tracks that weren't requested before
+        the request's deadline passed.
+
+    Raises:
+        UpstreamUnavailable: If Spotify fails or its circuit breaker is open.
+    """
+    cache = get_cache()
+    tracks = {}
+    missing_uris = []
+    for uri in dict.fromkeys(uris):
+        cached = cache.get(cache_key(TRACK, uri))
+        if cached is None:
+            missing_uris.append(uri)
+        else:
+            tracks[uri] = cached
+
+    for start in range(0, len(missing_uris), TRACKS_BATCH_SIZE):
+        batch = missing_uris[start:start + TRACKS_BATCH_SIZE]
+        try:
+            results = breakers["spotify"].call(sp.tracks, batch)
+        except DeadlineExceeded:
+            break # Out of time, the remaining tracks are left out.
+        fetched = {}
+        for uri, track in zip(batch, results['tracks']):
+            if not track:
+                continue
+            # Only the fields used by the app are kept.
+            fetched[uri] = {
+                "uri": uri,
+                "name": track['name'],
+                "artists": [{"id": artist['id'], "name": artist['name']} for artist in track['artists']],
+                "album_image": track['album']['images'][0]['url'] if track['album']['images'] else None,
+            }
+        cache.set_many({cache_key(TRACK, uri): track for uri, track in fetched.items()}, ttl=TTLS[TRACK])
+        tracks.update(fetched)
+    return tracks
+
+
+def get_audio_features(uris):
+    """
+    Retrieves the audio features of tracks in batched requests. Features are shared through the cache,
+    so only tracks that weren't seen before are requested from Spotify.
+
+    Attributes:
+        uris (list): A list of track URIs.
+
+    Returns:
+        features (dict): Track URIs mapped to dictionaries of AUDIO_FEATURE_FIELDS. Tracks without
+            audio features are left out. Only cached features are returned while the audio features
+            endpoint is restricted, and features are partial if Spotify fails or the request's
+            deadline passes.
+    """
+    cache = get_cache()
+    features = {}
+    missing_uris = []
+    for uri in dict.fromkeys(uris):
+        cached = cache.get(cache_key(AUDIO_FEATURES, uri))
+        if cached is None:
+            missing_uris.append(uri)
+        elif cached:
+            features[uri] = cached
+
+    # Spotify restricts the audio features endpoint for newly created apps. Once it answered with a
+    # restriction, it isn't called again until the flag expires.
+    restricted_key = cache_key(AUDIO_FEATURES, "endpoint_restricted")
+    if missing_uris and cache.get(restricted_key):
+        return features
+
+    def request_audio_features(batch):
+        """Requests the audio features of a batch, returning None if the endpoint is restricted."""
+        try:
+            return sp.audio_features(batch)
+        except spotipy.SpotifyException as e:
+            # A restricted endpoint isn't an outage, so it doesn't count as a failure of the circuit breaker.
+            if e.http_status in (403, 404):
+                return None
+            raise
+
+    for start in range(0, len(missing_uris), AUDIO_FEATURES_BATCH_SIZE):
+        batch = missing_uris[start:start + AUDIO_FEATURES_BATCH_SIZE]
+        try:
+            results = breakers["spotify"].call(request_audio_features, batch)
+        except UpstreamUnavailable as e:
+            logger.warning("Audio features are unavailable: %s", e)
+            break
+        if results is None:
+            logger.warning("Audio features endpoint is restricted for this app, ordering without audio features.")
+            cache.set(restricted_key, True, ttl=AUDIO_FEATURES_RESTRICTED_TTL)
+            break
+        fetched = {}
+        for uri, result in zip(batch, results):
+            fetched[uri] = {field: result[field] for field in AUDIO_FEATURE_FIELDS} if result else {}
+        # Empty features are cached too.
+        cache.set_many({cache_key(AUDIO_FEATURES, uri): track_features for uri, track_features in fetched.items()}, ttl=TTLS[AUDIO_FEATURES])
+        features.update((uri, track_features) for uri, track_features in fetched.items() if track_features)
+    return features
 
 
 def create_playlist(name="", description="", tracks=[]):
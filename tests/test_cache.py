@@ -0,0 +1,159 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cache import CacheBackend, MemoryCache, RedisCache, SQLiteCache, cache_key, normalize_text
+from resilience import request_deadline
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache()
+    if request.param == "sqlite":
+        return SQLiteCache(str(tmp_path / "cache.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisCache(client=fakeredis.FakeRedis())
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_cache_key_is_stable_and_namespaced():
+    key = cache_key("llm", normalize_text("  Songs for a RAINY day! "))
+    assert key == cache_key("llm", "songs for a rainy day")
+    assert key.startswith("heydj:v2:llm:")
+    assert key != cache_key("tags", "songs for a rainy day")
+
+
+def test_get_set_delete_round_trip(backend):
+    assert backend.get("key") is None
+    backend.set("key", {"uris": ["a", "b"], "cursor": 2})
+    assert backend.get("key") == {"uris": ["a", "b"], "cursor": 2}
+    backend.delete("key")
+    assert backend.get("key") is None
+
+
+def test_entries_expire(backend):
+    backend.set("key", "value", ttl=0.5)
+    assert backend.get("key") == "value"
+    time.sleep(0.6)
+    assert backend.get("key") is None
+
+
+def test_add_only_stores_missing_or_expired_keys(backend):
+    assert backend.add("key", "first", ttl=0.5)
+    assert not backend.add("key", "second")
+    assert backend.get("key") == "first"
+    time.sleep(0.6)
+    assert backend.add("key", "third")
+    assert backend.get("key") == "third"
+
+
+def test_delete_if_equal_keeps_other_values(backend):
+    backend.set("key", "token-a")
+    backend.delete_if_equal("key", "token-b")
+    assert backend.get("key") == "token-a"
+    backend.delete_if_equal("key", "token-a")
+    assert backend.get("key") is None
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_get_or_set_computes_concurrent_misses_once(backend):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: backend.get_or_set("key", compute), range(8)))
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert backend.get("key:lock") is None
+
+
+def test_get_or_set_respects_cache_if(backend):
+    assert backend.get_or_set("key", lambda: {"degraded": True}, cache_if=lambda value: not value["degraded"])
+    assert backend.get("key") is None
+    assert backend.get_or_set("key", lambda: {"degraded": False}) == {"degraded": False}
+    assert backend.get("key") == {"degraded": False}
+
+
+def test_get_or_set_doesnt_block_other_keys(backend):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_compute():
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(backend.get_or_set, "slow", slow_compute)
+        assert started.wait(5)
+        start = time.monotonic()
+        assert backend.get_or_set("fast", lambda: "fast") == "fast"
+        assert time.monotonic() - start < 1
+        release.set()
+        assert future.result() == "slow"
+
+
+def test_waiter_that_times_out_keeps_the_holders_lock(backend):
+    backend.add("key:lock", "other-replica", ttl=30)
+    assert backend.get_or_set("key", lambda: "value", lock_timeout=0.1, poll_interval=0.01) == "value"
+    assert backend.get("key:lock") == "other-replica"
+
+
+def test_get_or_set_waits_no_longer_than_the_request_deadline(backend):
+    backend.add("key:lock", "other-replica", ttl=30)
+    start = time.monotonic()
+    with request_deadline(0.2):
+        assert backend.get_or_set("key", lambda: "value", poll_interval=0.01) == "value"
+    assert time.monotonic() - start < 1
+
+
+def test_set_many_stores_every_value(backend):
+    backend.set_many({"a": 1, "b": [2]}, ttl=30)
+    assert backend.get("a") == 1
+    assert backend.get("b") == [2]
+
+
+def test_get_or_set_without_shared_lock_writes_only_the_value(backend):
+    writes = []
+    add = backend.add
+    backend.add = lambda *args, **kwargs: writes.append(args[0]) or add(*args, **kwargs)
+    assert backend.get_or_set("key", lambda: "value", shared_lock=False) == "value"
+    assert writes == []
+    assert backend.get("key") == "value"
+
+
+def test_memory_cache_skips_lock_entries():
+    cache = MemoryCache()
+    cache.add = None # Any lock entry would fail.
+    assert cache.get_or_set("key", lambda: "value") == "value"
+
+
+def test_sqlite_cache_purges_expired_entries(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), purge_interval=0)
+    cache.set("expired", "value", ttl=0.01)
+    cache.set("kept", "value", ttl=30)
+    time.sleep(0.05)
+    cache.set("other", "value")
+    keys = [row[0] for row in cache._connection.execute("SELECT key FROM cache ORDER BY key")]
+    assert keys == ["kept", "other"]
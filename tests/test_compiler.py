@@ -0,0 +1,126 @@
+import json
+import os
+
+import pytest
+
+# Dummy credentials, the Groq clients are created on import and answered by FakeGroq below.
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("langgraph")
+
+import graph.compiler
+import graph.models
+from cache import MemoryCache
+from graph.compiler import playlist_info_generator, should_retry
+from groq import APIConnectionError, APITimeoutError, BadRequestError, InternalServerError, RateLimitError
+from langchain_core.exceptions import OutputParserException
+from resilience import DeadlineExceeded
+
+REQUEST = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+
+
+def api_error(error_class, status_code, message):
+    return error_class(message, response=httpx.Response(status_code, request=REQUEST), body=None)
+
+
+class FakeGroq:
+    """
+    Answers Groq chat completion requests with the JSON object each graph node asks for.
+    Attributes:
+        search_function (str): Search function the classifier answers with.
+        failing_fields (dict): Output fields mapped to the number of requests to fail with HTTP 500.
+    """
+    def __init__(self, search_function="search_songs_by_tag"):
+        self.search_function = search_function
+        self.failing_fields = {}
+        self.fields = []
+
+    def __call__(self, request):
+        body = json.loads(request.content)
+        prompt = body["messages"][-1]["content"]
+        if "search_function" in prompt:
+            output = {"search_function": self.search_function}
+        elif '"description"' in prompt:
+            output = {"description": "A playlist for the road."}
+        elif '"playlist_name"' in prompt:
+            output = {"playlist_name": "Road Rock"}
+        else:
+            output = {"search_query": "rock"}
+        field = next(iter(output))
+        self.fields.append(field)
+        if self.failing_fields.get(field):
+            self.failing_fields[field] -= 1
+            return httpx.Response(500, json={"error": {"message": "Internal server error"}})
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(output)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        })
+
+
+@pytest.fixture
+def groq(monkeypatch):
+    groq = FakeGroq()
+    # The Groq clients of the nodes were created with this client, so its transport is replaced in place.
+    monkeypatch.setattr(graph.models.http_client, "_transport", httpx.MockTransport(groq))
+    monkeypatch.setattr(graph.compiler, "get_cache", lambda cache=MemoryCache(): cache)
+    return groq
+
+
+@pytest.mark.parametrize("exception, retried", [
+    (OutputParserException("Failed to parse"), True),
+    (APIConnectionError(request=REQUEST), True),
+    (APITimeoutError(request=REQUEST), False),
+    (api_error(RateLimitError, 429, "Rate limit reached"), True),
+    (api_error(InternalServerError, 500, "Internal server error"), True),
+    (api_error(BadRequestError, 400, "json_validate_failed: Failed to generate JSON"), True),
+    (api_error(BadRequestError, 400, "Invalid model"), False),
+    (DeadlineExceeded("Deadline exceeded before running query_classifier."), False),
+    (ValueError("unexpected"), False),
+])
+def test_should_retry(exception, retried):
+    assert should_retry(exception) is retried
+
+
+def test_playlist_info_is_generated_and_cached(groq):
+    playlist_info = playlist_info_generator("Rock songs for a road trip", thread_id="cached")
+    assert playlist_info == {
+        "input": "Rock songs for a road trip",
+        "description": "A playlist for the road.",
+        "playlist_name": "Road Rock",
+        "search_function": "search_songs_by_tag",
+        "search_query": "rock",
+        "degraded": False,
+    }
+    assert playlist_info_generator("rock songs for a road trip!", thread_id="other") == playlist_info
+    assert groq.fields == ["search_function", "search_query", "playlist_name", "description"]
+
+
+def test_failed_run_resumes_from_its_last_checkpoint(groq):
+    groq.failing_fields = {"description": 3} # Fails every attempt of the retry policy.
+    with pytest.raises(InternalServerError):
+        playlist_info_generator("Rock songs", thread_id="resume")
+    assert graph.compiler.compiled_workflow.get_state({"configurable": {"thread_id": "resume"}}).next == ("description_generator",)
+
+    groq.fields.clear()
+    playlist_info = playlist_info_generator("Rock songs", thread_id="resume")
+    assert playlist_info["description"] == "A playlist for the road."
+    assert groq.fields == ["description"]
+
+
+def test_failed_run_of_another_input_is_dropped(groq):
+    groq.failing_fields = {"description": 3}
+    with pytest.raises(InternalServerError):
+        playlist_info_generator("Rock songs", thread_id="reused")
+
+    groq.search_function = "search_songs"
+    groq.fields.clear()
+    playlist_info = playlist_info_generator("Jazz songs", thread_id="reused")
+    assert playlist_info["input"] == "Jazz songs"
+    assert playlist_info["search_function"] == "search_songs"
+    assert playlist_info["degraded"] is False
+    assert groq.fields == ["search_function", "search_query", "playlist_name", "description"]
@@ -0,0 +1,96 @@
+from typing import Literal
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.exceptions import OutputParserException
+from pydantic import BaseModel
+
+from graph.parsers import TolerantOutputParser, _repair_json, extract_json, get_parse_metrics
+
+
+class Query(BaseModel):
+    search_query: str
+
+
+class Classifier(BaseModel):
+    search_function: Literal["search_songs", "search_songs_by_lyrics", "search_songs_by_tag"]
+
+
+class Playlist(BaseModel):
+    playlist_name: str
+    description: str
+
+
+def test_extract_json_reads_clean_json_without_repair():
+    assert extract_json('{"search_query": "love"}') == ({"search_query": "love"}, False)
+
+
+@pytest.mark.parametrize("text", [
+    'Sure! Here is the output: {"search_query": "love"} Let me know if you need more.',
+    '```json\n{"search_query": "love"}\n```',
+    "{'search_query': 'love'}",
+    '{"search_query": "love",}',
+    "{“search_query”: “love”}",
+    '{\'search_query\': "love"}',
+])
+def test_extract_json_repairs_common_mistakes(text):
+    assert extract_json(text) == ({"search_query": "love"}, True)
+
+
+def test_extract_json_keeps_braces_and_quotes_inside_strings():
+    text = 'Output: {"description": "Songs {for} the \\"road\\""} done'
+    assert extract_json(text) == ({"description": 'Songs {for} the "road"'}, True)
+
+
+@pytest.mark.parametrize("text", ["no json here", '{"search_query": "love"', "{search_query: love}"])
+def test_extract_json_rejects_text_without_a_json_object(text):
+    with pytest.raises(ValueError):
+        extract_json(text)
+
+
+def test_repair_json_only_touches_single_quotes_around_keys_and_values():
+    assert _repair_json('{"description": "Rock \'n\' roll", \'playlist_name\': \'Rock\',}') == (
+        '{"description": "Rock \'n\' roll", "playlist_name": "Rock"}'
+    )
+
+
+def test_parser_records_parse_outcomes():
+    parser = TolerantOutputParser(pydantic_object=Query, node="test_outcomes")
+    parser.parse('{"search_query": "love"}')
+    parser.parse("```json\n{'search_query': 'love'}\n```")
+    with pytest.raises(OutputParserException):
+        parser.parse('{"query": "love"}')
+    assert get_parse_metrics()["test_outcomes"] == {"parsed": 1, "repaired": 1, "failed": 1, "failure_rate": 1 / 3}
+
+
+def test_plain_text_is_used_for_a_single_string_field():
+    parser = TolerantOutputParser(pydantic_object=Query, node="test_plain_text")
+    assert parser.parse('  "hip hop"  ').search_query == "hip hop"
+
+
+@pytest.mark.parametrize("text", [
+    "Sure, here is the tag: rock",
+    "The most relevant tag for this request would probably be rock music",
+    "rock\nIt fits the request best.",
+])
+def test_prose_is_rejected_for_a_single_string_field(text):
+    parser = TolerantOutputParser(pydantic_object=Query, node="test_prose")
+    with pytest.raises(OutputParserException):
+        parser.parse(text)
+
+
+def test_plain_text_must_be_an_allowed_literal_value():
+    parser = TolerantOutputParser(pydantic_object=Classifier, node="test_literal")
+    assert parser.parse("search_songs_by_tag").search_function == "search_songs_by_tag"
+    with pytest.raises(OutputParserException):
+        parser.parse("I think search_songs_by_tag fits best.")
+    with pytest.raises(OutputParserException):
+        parser.parse('{"search_function": "search_by_mood"}')
+
+
+def test_plain_text_isnt_used_for_models_with_several_fields():
+    parser = TolerantOutputParser(pydantic_object=Playlist, node="test_several_fields")
+    with pytest.raises(OutputParserException):
+        parser.parse("Road Trip")
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+# Dummy credentials, pipeline imports the Spotify and Genius clients.
+for name in ("SPOTIPY_CLIENT_ID", "SPOTIPY_CLIENT_SECRET", "GENIUS_ACCESS_TOKEN", "LASTFM_API_KEY"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("SPOTIPY_REDIRECT_URI", "http://localhost:8501/callback")
+
+pipeline = pytest.importorskip("pipeline")
+
+from cache import MemoryCache
+from playlist_store import PlaylistStore
+from resilience import UpstreamUnavailable
+
+
+def song(index):
+    return {"artist": f"Artist {index}", "track": f"Song {index}"}
+
+
+def uri(index):
+    return f"spotify:track:{index}"
+
+
+class Upstreams:
+    """Stand-ins for the search functions used by get_search_results, recording their calls."""
+    def __init__(self):
+        self.searches = []
+        self.candidate_requests = []
+        self.resolved = []
+        self.candidates_unavailable = False
+        self.resolution_fails_at = None
+
+    def search_songs(self, query="", limit=25, offset=0):
+        self.searches.append((limit, offset))
+        return [f"spotify:track:search-{index}" for index in range(offset, offset + limit)]
+
+    def get_tag_candidates(self, query="", limit=25):
+        self.candidate_requests.append(limit)
+        if self.candidates_unavailable:
+            raise UpstreamUnavailable("lastfm is unavailable")
+        return [song(index) for index in range(limit)]
+
+    def resolve_candidates(self, candidates, query=""):
+        index = int(candidates[0]["track"].split()[-1])
+        if index == self.resolution_fails_at:
+            raise UpstreamUnavailable("spotify is unavailable")
+        self.resolved.append(index)
+        return [uri(index)]
+
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    upstreams = Upstreams()
+    monkeypatch.setattr(pipeline, "playlist_store", PlaylistStore(cache=MemoryCache()))
+    monkeypatch.setattr(pipeline, "search_songs", upstreams.search_songs)
+    monkeypatch.setattr(pipeline, "get_tag_candidates", upstreams.get_tag_candidates)
+    monkeypatch.setattr(pipeline, "resolve_candidates", upstreams.resolve_candidates)
+    return upstreams
+
+
+SONG_SEARCH = {"search_function": "search_songs", "search_query": "road trip"}
+TAG_SEARCH = {"search_function": "search_songs_by_tag", "search_query": "Rock"}
+
+
+def test_song_search_continues_at_the_next_offset(upstreams):
+    first = pipeline.get_search_results(SONG_SEARCH, 5)
+    second = pipeline.get_search_results(SONG_SEARCH, 8)
+    assert second[:5] == first
+    assert len(second) == 8
+    assert upstreams.searches == [(5, 0), (3, 5)]
+
+
+def test_stored_results_are_reused(upstreams):
+    first = pipeline.get_search_results(TAG_SEARCH, 4)
+    assert pipeline.get_search_results(dict(TAG_SEARCH, search_query=" rock! "), 3) == first[:3]
+    assert upstreams.candidate_requests == [4]
+    assert upstreams.resolved == [0, 1, 2, 3]
+
+
+def test_tag_search_refetches_a_longer_ranking_and_resolves_only_new_songs(upstreams):
+    assert pipeline.get_search_results(TAG_SEARCH, 3) == [uri(0), uri(1), uri(2)]
+    assert pipeline.get_search_results(TAG_SEARCH, 5) == [uri(index) for index in range(5)]
+    assert upstreams.candidate_requests == [3, 5]
+    assert upstreams.resolved == [0, 1, 2, 3, 4]
+
+
+def test_resolution_progress_is_kept_when_spotify_fails(upstreams):
+    upstreams.resolution_fails_at = 2
+    assert pipeline.get_search_results(TAG_SEARCH, 4) == [uri(0), uri(1)]
+    search = pipeline.playlist_store.get_search("search_songs_by_tag", "rock")
+    assert search["cursor"] == 2
+
+    upstreams.resolution_fails_at = None
+    assert pipeline.get_search_results(TAG_SEARCH, 4) == [uri(index) for index in range(4)]
+    assert upstreams.resolved == [0, 1, 2, 3]
+
+
+def test_resolution_failure_without_results_is_raised(upstreams):
+    upstreams.resolution_fails_at = 0
+    with pytest.raises(UpstreamUnavailable):
+        pipeline.get_search_results(TAG_SEARCH, 3)
+
+
+def test_fill_up_tracks_are_not_stored(upstreams):
+    upstreams.candidates_unavailable = True
+    results = pipeline.get_search_results(TAG_SEARCH, 3)
+    assert results == ["spotify:track:search-0", "spotify:track:search-1", "spotify:track:search-2"]
+    assert pipeline.playlist_store.get_search("search_songs_by_tag", "rock")["track_uris"] == []
+
+    # Once Last.fm is back, the tag search is used again.
+    upstreams.candidates_unavailable = False
+    assert pipeline.get_search_results(TAG_SEARCH, 3) == [uri(0), uri(1), uri(2)]
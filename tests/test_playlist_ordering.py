@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+# Dummy credentials, playlist_ordering imports the Spotify and Genius clients.
+for name in ("SPOTIPY_CLIENT_ID", "SPOTIPY_CLIENT_SECRET", "GENIUS_ACCESS_TOKEN", "LASTFM_API_KEY"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("SPOTIPY_REDIRECT_URI", "http://localhost:8501/callback")
+
+np = pytest.importorskip("numpy")
+playlist_ordering = pytest.importorskip("playlist_ordering")
+
+
+def test_remove_outliers_flags_distant_tracks():
+    matrix = np.array([[0.50, 120.0], [0.52, 122.0], [0.48, 118.0], [0.51, 121.0], [0.49, 119.0], [0.95, 200.0]])
+    mask = playlist_ordering.remove_outliers(matrix, keep=3)
+    assert mask.tolist() == [True, True, True, True, True, False]
+
+
+def test_remove_outliers_ignores_columns_without_spread():
+    # Most tracks share a tempo, so its MAD is zero. A 10 BPM difference isn't an outlier.
+    matrix = np.array([[0.50, 120.0], [0.52, 120.0], [0.48, 120.0], [0.51, 120.0], [0.49, 130.0]])
+    assert playlist_ordering.remove_outliers(matrix, keep=3).all()
+
+
+def test_remove_outliers_keeps_the_least_outlying_tracks():
+    matrix = np.array([[0.0], [0.1], [0.2], [5.0], [9.0]])
+    mask = playlist_ordering.remove_outliers(matrix, keep=4)
+    assert mask.tolist() == [True, True, True, True, False]
+
+
+def test_sequence_tracks_keeps_search_rank_without_other_costs():
+    matrix = np.zeros((4, 1))
+    assert playlist_ordering.sequence_tracks(matrix, [["a"], ["b"], ["c"], ["d"]]) == [0, 1, 2, 3]
+
+
+def test_sequence_tracks_spreads_out_artists():
+    matrix = np.zeros((4, 1))
+    artists = [["a"], ["a", "x"], ["b"], ["c"]]
+    order = playlist_ordering.sequence_tracks(matrix, artists)
+    assert order == [0, 2, 3, 1]
+
+
+def test_sequence_tracks_prefers_smooth_transitions():
+    matrix = np.array([[0.0, 100.0], [1.0, 180.0], [0.1, 105.0], [0.9, 175.0]])
+    order = playlist_ordering.sequence_tracks(matrix, [["a"], ["b"], ["c"], ["d"]])
+    assert sorted(order) == [0, 1, 2, 3]
+    assert order[:2] == [0, 2]
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from resilience import (
+    MIN_CALL_TIMEOUT, CircuitBreaker, CircuitOpenError, DeadlineExceeded, UpstreamUnavailable, capped_timeout,
+    check_deadline, remaining_time, request_deadline,
+)
+
+
+def fail():
+    raise ConnectionError("connection refused")
+
+
+def test_no_deadline_outside_a_request():
+    assert remaining_time() is None
+    assert capped_timeout(5.0) == 5.0
+    check_deadline("calling spotify")
+
+
+def test_timeouts_are_capped_by_the_time_left():
+    with request_deadline(1.0):
+        assert capped_timeout(5.0) <= 1.0
+        assert capped_timeout(0.5) == 0.5
+    with request_deadline(0.0):
+        assert capped_timeout(5.0) == MIN_CALL_TIMEOUT
+
+
+def test_calls_are_rejected_after_the_deadline():
+    breaker = CircuitBreaker("spotify")
+    with request_deadline(0.05):
+        assert breaker.call(lambda: "ok") == "ok"
+        time.sleep(0.1)
+        with pytest.raises(DeadlineExceeded):
+            check_deadline("running query_classifier")
+        with pytest.raises(DeadlineExceeded):
+            breaker.call(lambda: "ok")
+    assert breaker.call_timeout() == breaker.timeout
+
+
+def test_breaker_opens_after_consecutive_failures_and_recovers():
+    breaker = CircuitBreaker("genius", failure_threshold=2, reset_timeout=0.1)
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailable):
+            breaker.call(fail)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+
+    time.sleep(0.15)
+    assert breaker.state == "half_open"
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+    assert breaker.health()["rejections"] == 1
+
+
+def test_failed_trial_call_opens_the_breaker_again():
+    breaker = CircuitBreaker("lastfm", failure_threshold=1, reset_timeout=0.05)
+    with pytest.raises(UpstreamUnavailable):
+        breaker.call(fail)
+    time.sleep(0.1)
+    with pytest.raises(UpstreamUnavailable):
+        breaker.call(fail)
+    assert breaker.state == "open"
+
+
+def timed_out_call(breaker):
+    """Stands in for an HTTP call that runs into its timeout."""
+    time.sleep(breaker.call_timeout())
+    raise TimeoutError("read timed out")
+
+
+def test_calls_cut_short_by_the_deadline_dont_open_the_breaker():
+    breaker = CircuitBreaker("spotify", timeout=5.0, failure_threshold=3)
+    for _ in range(3):
+        with request_deadline(0.2):
+            with pytest.raises(DeadlineExceeded):
+                breaker.call(timed_out_call, breaker)
+    health = breaker.health()
+    assert health["state"] == "closed"
+    assert health["failures"] == 0
+    assert health["deadline_cutoffs"] == 3
+
+
+def test_timeouts_of_the_service_still_count_as_failures():
+    breaker = CircuitBreaker("spotify", timeout=0.05, failure_threshold=3)
+    for _ in range(3):
+        with request_deadline(5.0):
+            with pytest.raises(UpstreamUnavailable) as error:
+                breaker.call(timed_out_call, breaker)
+            assert not isinstance(error.value, DeadlineExceeded)
+    assert breaker.state == "open"
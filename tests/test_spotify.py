@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+# Dummy credentials, spotify creates the Spotify and Genius clients on import.
+for name in ("SPOTIPY_CLIENT_ID", "SPOTIPY_CLIENT_SECRET", "GENIUS_ACCESS_TOKEN", "LASTFM_API_KEY"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("SPOTIPY_REDIRECT_URI", "http://localhost:8501/callback")
+
+spotipy = pytest.importorskip("spotipy")
+spotify = pytest.importorskip("spotify")
+
+from cache import MemoryCache
+from resilience import CircuitBreaker
+
+
+class RestrictedSpotify:
+    """Spotify client of an app the audio features endpoint is restricted for."""
+    def __init__(self):
+        self.calls = 0
+
+    def audio_features(self, tracks):
+        self.calls += 1
+        raise spotipy.SpotifyException(403, -1, "Forbidden")
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = MemoryCache()
+    monkeypatch.setattr(spotify, "get_cache", lambda: cache)
+    monkeypatch.setitem(spotify.breakers, "spotify", CircuitBreaker("spotify"))
+    return cache
+
+
+def test_restricted_audio_features_endpoint_is_remembered(cache, monkeypatch):
+    client = RestrictedSpotify()
+    monkeypatch.setattr(spotify, "sp", client)
+
+    assert spotify.get_audio_features(["spotify:track:a", "spotify:track:b"]) == {}
+    assert spotify.get_audio_features(["spotify:track:c"]) == {}
+    assert client.calls == 1
+    assert spotify.breakers["spotify"].health()["failures"] == 0
+
+
+def test_cached_audio_features_are_served_while_restricted(cache, monkeypatch):
+    features = {field: 0.5 for field in spotify.AUDIO_FEATURE_FIELDS}
+    cache.set(spotify.cache_key(spotify.AUDIO_FEATURES, "spotify:track:a"), features)
+    monkeypatch.setattr(spotify, "sp", RestrictedSpotify())
+
+    assert spotify.get_audio_features(["spotify:track:a", "spotify:track:b"]) == {"spotify:track:a": features}